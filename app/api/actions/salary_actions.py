@@ -1,12 +1,73 @@
+import datetime
 import uuid
+from typing import AsyncIterator, Sequence
 
 from fastapi import HTTPException
-from sqlalchemy import select
+from sqlalchemy import (
+    DateTime,
+    Float,
+    Row,
+    Uuid,
+    cast,
+    column,
+    func,
+    insert,
+    literal,
+    select,
+    tuple_,
+    update,
+    values
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.schemas import UpdateSalary
-from db.models import Salary, User
-from api.actions.user_actions import get_user_by_uuid_action
+from api.schemas import BulkUpdateSalary, UpdateSalary
+from db.models import (
+    Salary,
+    SalaryHistory,
+    SalaryRaisesMonth,
+    SalarySketchBucket,
+    User
+)
+from db.partitions import ensure_salary_history_partition, month_bounds
+from db.salary_stats import RELATIVE_ACCURACY, quantiles
+from api.actions.user_actions import invalidate_principal
+from db.session import after_commit
+from settings import EXPORT_FETCH_SIZE
+from utils.response_cache import response_cache
+
+
+async def get_salary_by_user_id_action(
+        user_id: uuid.UUID,
+        session: AsyncSession
+) -> Salary | HTTPException:
+    """
+    Получение зарплаты пользователя без загрузки самого пользователя
+    """
+
+    query = select(Salary).where(Salary.user_id == user_id)
+    salary = await session.scalar(query)
+    if salary is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Пользователь с uuid {user_id} не найден"
+        )
+    return salary
+
+
+async def get_salary_version_action(
+        user_id: uuid.UUID,
+        session: AsyncSession
+) -> tuple[uuid.UUID, int] | None:
+    """
+    Id и версия зарплаты пользователя без загрузки остальных полей,
+    запрос обслуживается только индексом
+    """
+
+    query = select(Salary.id, Salary.version).where(
+        Salary.user_id == user_id
+    )
+    row = (await session.execute(query)).one_or_none()
+    return tuple(row) if row is not None else None
 
 
 async def update_user_salary_action(
@@ -15,20 +76,318 @@ async def update_user_salary_action(
         session: AsyncSession
 ) -> User | HTTPException:
     """
-    Обновление данных о зарплате
+    Обновление данных о зарплате.
+
+    Зарплата обновляется одним UPDATE ... FROM users RETURNING, который
+    сразу возвращает нужные для ответа поля пользователя; запись в историю
+    выполняется в том же запросе через CTE
     """
 
-    user = await get_user_by_uuid_action(id=user_id, session=session)
-    if user is None:
+    increase_date = (
+        body.increase_date.replace(tzinfo=None) if body.increase_date else None
+    )
+    updated = (
+        update(Salary)
+        .where(Salary.user_id == User.id, Salary.user_id == user_id)
+        .values(
+            current_salary=func.coalesce(
+                body.current_salary or None, Salary.current_salary
+            ),
+            increase_date=func.coalesce(increase_date, Salary.increase_date),
+            version=Salary.version + 1,
+        )
+        .returning(
+            Salary.id.label("salary_id"),
+            Salary.current_salary,
+            Salary.increase_date,
+            Salary.version,
+            Salary.created_date.label("salary_created_date"),
+            User.id,
+            User.username,
+            User.email,
+            User.first_name,
+            User.last_name,
+            User.created_date,
+        )
+        .cte("updated")
+    )
+    effective_date = datetime.datetime.utcnow()
+    history = (
+        insert(SalaryHistory)
+        .from_select(
+            ["id", "effective_date", "user_id", "current_salary",
+             "increase_date"],
+            select(
+                literal(uuid.uuid4(), Uuid),
+                literal(effective_date, DateTime),
+                updated.c.id,
+                updated.c.current_salary,
+                updated.c.increase_date
+            )
+        )
+        .returning(SalaryHistory.user_id)
+        .cte("history")
+    )
+    # соединение с history нужно, чтобы CTE попал в запрос
+    query = select(updated).join(
+        history, history.c.user_id == updated.c.id
+    )
+
+    await ensure_salary_history_partition(
+        session=session, moment=effective_date
+    )
+    row = (await session.execute(query)).mappings().one_or_none()
+    if row is None:
         raise HTTPException(
             status_code=404,
             detail=f"Пользователь с id {user_id} не найден"
         )
-    async with session.begin():
-        query = select(Salary).where(Salary.user == user)
-        salary = await session.scalar(query)
-        if body.current_salary:
-            salary.current_salary = body.current_salary
-        if body.increase_date:
-            salary.increase_date = body.increase_date.replace(tzinfo=None)
-        return user
+
+    def invalidate() -> None:
+        invalidate_principal(user_id=user_id)
+        response_cache.invalidate(user_id)
+
+    after_commit(session, invalidate)
+
+    user = User(
+        id=row["id"],
+        username=row["username"],
+        email=row["email"],
+        first_name=row["first_name"],
+        last_name=row["last_name"],
+        created_date=row["created_date"]
+    )
+    user.salary = Salary(
+        id=row["salary_id"],
+        user_id=row["id"],
+        current_salary=row["current_salary"],
+        increase_date=row["increase_date"],
+        version=row["version"],
+        created_date=row["salary_created_date"]
+    )
+    return user
+
+
+# сколько строк передавать в одном VALUES, чтобы не упереться в лимит
+# параметров запроса
+BULK_UPDATE_CHUNK_SIZE = 5000
+
+
+async def update_salaries_bulk_action(
+        items: list[BulkUpdateSalary],
+        atomic: bool,
+        session: AsyncSession
+) -> tuple[int, list[uuid.UUID]] | HTTPException:
+    """
+    Массовое обновление зарплат одним UPDATE ... FROM (VALUES ...).
+    Возвращает количество обновленных зарплат и id ненайденных пользователей
+    """
+
+    # при повторах user_id побеждает последняя запись
+    rows = list({
+        item.user_id: (
+            item.user_id,
+            item.current_salary,
+            item.increase_date.replace(tzinfo=None)
+            if item.increase_date else None
+        )
+        for item in items
+    }.values())
+
+    updated: set[uuid.UUID] = set()
+    for start in range(0, len(rows), BULK_UPDATE_CHUNK_SIZE):
+        new_salaries = values(
+            column("user_id", Uuid),
+            column("current_salary", Float),
+            column("increase_date", DateTime),
+            name="new_salaries"
+        ).data(rows[start:start + BULK_UPDATE_CHUNK_SIZE])
+        query = (
+            update(Salary)
+            .where(Salary.user_id == new_salaries.c.user_id)
+            # колонка VALUES из одних NULL получает в Postgres тип text,
+            # поэтому тип указывается явно
+            .values(
+                current_salary=func.coalesce(
+                    cast(new_salaries.c.current_salary, Float),
+                    Salary.current_salary
+                ),
+                increase_date=func.coalesce(
+                    cast(new_salaries.c.increase_date, DateTime),
+                    Salary.increase_date
+                ),
+                version=Salary.version + 1,
+            )
+            .returning(
+                Salary.user_id,
+                Salary.current_salary,
+                Salary.increase_date
+            )
+        )
+        result = (await session.execute(query)).mappings().all()
+        updated.update(row["user_id"] for row in result)
+        await add_salary_history(rows=result, session=session)
+
+    missing = [row[0] for row in rows if row[0] not in updated]
+    if atomic and missing:
+        # транзакция запроса не будет зафиксирована и откатится
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "message": "Пользователи не найдены, изменения отменены",
+                "missing": [str(user_id) for user_id in missing],
+            }
+        )
+
+    def invalidate() -> None:
+        for user_id in updated:
+            invalidate_principal(user_id=user_id)
+        response_cache.invalidate(*updated)
+
+    after_commit(session, invalidate)
+    return len(updated), missing
+
+
+async def add_salary_history(rows: list, session: AsyncSession) -> None:
+    """
+    Запись новых значений зарплат в историю в текущей транзакции
+    """
+
+    if not rows:
+        return
+    effective_date = datetime.datetime.utcnow()
+    await ensure_salary_history_partition(
+        session=session, moment=effective_date
+    )
+    await session.execute(insert(SalaryHistory), [
+        {
+            "id": uuid.uuid4(),
+            "effective_date": effective_date,
+            "user_id": row["user_id"],
+            "current_salary": row["current_salary"],
+            "increase_date": row["increase_date"],
+        }
+        for row in rows
+    ])
+
+
+async def get_salary_history_action(
+        user_id: uuid.UUID,
+        session: AsyncSession,
+        limit: int,
+        date_from: datetime.datetime | None = None,
+        date_to: datetime.datetime | None = None,
+        after: tuple[datetime.datetime, uuid.UUID] | None = None
+) -> list[SalaryHistory]:
+    """
+    Получение истории зарплаты пользователя за период [date_from, date_to)
+    """
+
+    query = (
+        select(SalaryHistory)
+        .where(SalaryHistory.user_id == user_id)
+        .order_by(SalaryHistory.effective_date, SalaryHistory.id)
+        .limit(limit)
+    )
+    if date_from is not None:
+        query = query.where(
+            SalaryHistory.effective_date >= date_from.replace(tzinfo=None)
+        )
+    if date_to is not None:
+        query = query.where(
+            SalaryHistory.effective_date < date_to.replace(tzinfo=None)
+        )
+    if after is not None:
+        query = query.where(
+            tuple_(SalaryHistory.effective_date, SalaryHistory.id) > after
+        )
+    history = await session.scalars(query)
+    return history.all()
+
+
+async def get_salary_stats_action(
+        session: AsyncSession,
+        months: int
+) -> dict:
+    """
+    Сводка по зарплатам и повышения на months месяцев вперед.
+
+    Читаются только сводные таблицы, которые триггеры salaries обновляют
+    при каждом изменении: около тысячи бакетов скетча при любом
+    количестве сотрудников
+    """
+
+    query = (
+        select(SalarySketchBucket.bucket, SalarySketchBucket.count,
+               SalarySketchBucket.total)
+        .where(SalarySketchBucket.count != 0)
+        .order_by(SalarySketchBucket.bucket)
+    )
+    buckets = (await session.execute(query)).all()
+
+    start, end = month_bounds(datetime.datetime.utcnow())
+    for _ in range(months - 1):
+        _, end = month_bounds(end)
+    query = (
+        select(SalaryRaisesMonth.month, SalaryRaisesMonth.count)
+        .where(
+            SalaryRaisesMonth.month >= start,
+            SalaryRaisesMonth.month < end,
+            SalaryRaisesMonth.count != 0
+        )
+        .order_by(SalaryRaisesMonth.month)
+    )
+    raises = (await session.execute(query)).all()
+
+    count = sum(bucket.count for bucket in buckets)
+    total = sum(bucket.total for bucket in buckets)
+    p50, p90, p95, p99 = quantiles(
+        [(bucket.bucket, bucket.count) for bucket in buckets],
+        (0.5, 0.9, 0.95, 0.99)
+    )
+    return {
+        "count": count,
+        "total": total,
+        "average": total / count if count else None,
+        "p50": p50,
+        "p90": p90,
+        "p95": p95,
+        "p99": p99,
+        "relative_accuracy": RELATIVE_ACCURACY,
+        "upcoming_raises": [
+            {"month": month, "raises": raises_count}
+            for month, raises_count in raises
+        ],
+    }
+
+
+def salary_export_query():
+    """
+    Пользователи с зарплатами в порядке создания, только нужные колонки
+    без сборки объектов ORM
+    """
+
+    return (
+        select(
+            User.id, User.username, User.email, User.first_name,
+            User.last_name, Salary.id, Salary.current_salary,
+            Salary.increase_date
+        )
+        .join(Salary, Salary.user_id == User.id)
+        .order_by(User.created_date, User.id)
+    )
+
+
+async def stream_salary_export_action(
+        session: AsyncSession,
+        fetch_size: int = EXPORT_FETCH_SIZE
+) -> AsyncIterator[Sequence[Row]]:
+    """
+    Выгрузка зарплат кусками по fetch_size строк через серверный курсор:
+    в памяти одновременно находится только один кусок
+    """
+
+    query = salary_export_query().execution_options(yield_per=fetch_size)
+    result = await session.stream(query)
+    async for rows in result.partitions():
+        yield rows
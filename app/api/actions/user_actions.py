@@ -1,22 +1,101 @@
+import calendar
+import datetime
 import uuid
+from typing import AsyncIterator
 
 from fastapi import Depends, HTTPException
 from fastapi.security.oauth2 import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from sqlalchemy import delete, select
+from pydantic import ValidationError
+from sqlalchemy import (
+    DateTime,
+    Select,
+    Uuid,
+    delete,
+    insert,
+    literal,
+    or_,
+    select,
+    tuple_,
+    update
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.schemas import CreateUser
-from db.models import Salary, User
-from db.session import get_session
-from settings import ALGORITHM, SECRET_KEY
-from utils.hashing import Hasher
+from api.schemas import BulkUserResult, CreateUser
+from db.models import (
+    RefreshToken,
+    RefreshTokenRevocation,
+    Salary,
+    User,
+    token_version_seq
+)
+from db.replicas import get_read_session
+from db.session import after_commit, get_session
+from settings import (
+    AUTH_MODE,
+    PRINCIPAL_CACHE_MAX_SIZE,
+    PRINCIPAL_CACHE_TTL_SECONDS,
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    STREAM_FETCH_SIZE
+)
+from utils.cache import TTLCache
+from utils.hashing import hashing_service
+from utils.response_cache import response_cache
+from utils.revocations import refresh_token_revocations
+from utils.security import (
+    Principal,
+    create_refresh_token,
+    decode_access_token,
+    decode_refresh_token,
+    hash_refresh_token
+)
+from utils.token_versions import token_versions
+from utils.tokens import InvalidToken
 
 
 # зависимость, которая дает понять FastAPI, что текущий роут
 # требует аутентификации.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/token")
 
+USERNAME_TAKEN = "Пользователь с данным username уже существует"
+EMAIL_TAKEN = "Пользователь с данным email уже существует"
+# ограничения уникальности таблицы users и соответствующие им ошибки
+UNIQUE_CONSTRAINT_DETAILS = {
+    "users_username_key": USERNAME_TAKEN,
+    "users_email_key": EMAIL_TAKEN,
+}
+
+# кеш пользователей по полю sub токена, чтобы не ходить в БД
+# на каждый аутентифицированный запрос
+principal_cache = TTLCache(
+    max_size=PRINCIPAL_CACHE_MAX_SIZE,
+    ttl=PRINCIPAL_CACHE_TTL_SECONDS
+)
+
+
+def invalidate_principal(user_id: uuid.UUID) -> None:
+    """
+    Удаление пользователя из кеша после изменения его данных
+    """
+
+    principal_cache.invalidate(str(user_id))
+
+
+def forget_user_after_commit(
+        user_id: uuid.UUID,
+        session: AsyncSession
+) -> None:
+    """
+    Сброс кеша и версии токенов пользователя после фиксации транзакции,
+    чтобы параллельный запрос не закешировал старые данные
+    """
+
+    def forget() -> None:
+        invalidate_principal(user_id=user_id)
+        token_versions.forget(user_id=user_id)
+
+    after_commit(session, forget)
+
 
 async def get_user_by_uuid_action(
         id: uuid.UUID,
@@ -26,10 +105,20 @@ async def get_user_by_uuid_action(
     Получение пользователя по uuid
     """
 
-    async with session.begin():
-        query = select(User).where(User.id == id)
-        user = await session.scalar(query)
-        return user
+    query = select(User).where(User.id == id)
+    return await session.scalar(query)
+
+
+async def get_user_by_username_action(
+        username: str,
+        session: AsyncSession
+) -> User | None:
+    """
+    Получение пользователя по username
+    """
+
+    query = select(User).where(User.username == username)
+    return await session.scalar(query)
 
 
 async def create_user_action(
@@ -37,24 +126,156 @@ async def create_user_action(
         session: AsyncSession
 ) -> User | HTTPException:
     """
-    Создаем юзера в БД
+    Создаем юзера в БД.
+
+    Пользователь и его зарплата вставляются одним запросом с CTE,
+    занятые username или email определяются по имени нарушенного
+    ограничения уникальности
     """
 
-    await check_unique_username_and_email(body=body, session=session)
+    check_reserved_username_and_email(body=body)
+    password = await hashing_service.hash_password(password=body.password)
+
+    user = User(
+        id=uuid.uuid4(),
+        username=body.username,
+        email=body.email,
+        password=password,
+        first_name=body.first_name,
+        last_name=body.last_name,
+        role="user",
+        created_date=datetime.datetime.utcnow()
+    )
+    salary = Salary(id=uuid.uuid4(), created_date=user.created_date)
 
-    async with session.begin():
-        user = User(
-            username=body.username,
-            email=body.email,
-            password=Hasher.hash_password(password=body.password),
-            first_name=body.first_name,
-            last_name=body.last_name
+    new_user = (
+        insert(User)
+        .values(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            password=user.password,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            role=user.role,
+            created_date=user.created_date
         )
-        salary = Salary()
-        salary.user = user
-        session.add(user)
-        session.add(salary)
-        return user
+        .returning(User.id)
+        .cte("new_user")
+    )
+    query = (
+        insert(Salary)
+        .from_select(
+            ["id", "user_id", "created_date"],
+            select(
+                literal(salary.id, Uuid),
+                new_user.c.id,
+                literal(salary.created_date, DateTime)
+            )
+        )
+        .add_cte(new_user)
+    )
+    try:
+        await session.execute(query)
+    except IntegrityError as error:
+        detail = UNIQUE_CONSTRAINT_DETAILS.get(constraint_name(error))
+        if detail is None:
+            raise
+        raise HTTPException(status_code=422, detail=detail)
+    after_commit(session, response_cache.invalidate)
+
+    salary.user_id = user.id
+    salary.user = user
+    return user
+
+
+async def create_users_bulk_action(
+        rows: list[dict],
+        session: AsyncSession
+) -> list[BulkUserResult] | HTTPException:
+    """
+    Массовое создание пользователей с отчетом по каждой строке
+    """
+
+    results: list[BulkUserResult] = []
+    valid: dict[int, CreateUser] = {}
+    for index, row in enumerate(rows):
+        try:
+            body = CreateUser.parse_obj(row)
+            check_reserved_username_and_email(body=body)
+            valid[index] = body
+        except HTTPException as error:
+            results.append(BulkUserResult(
+                index=index, status="error", detail=error.detail
+            ))
+        except ValidationError as error:
+            results.append(BulkUserResult(
+                index=index, status="error", detail=error.errors()
+            ))
+
+    # уникальность проверяется одним запросом на всю пачку
+    usernames = {body.username for body in valid.values()}
+    emails = {body.email for body in valid.values()}
+    taken_usernames, taken_emails = set(), set()
+    if valid:
+        query = select(User.username, User.email).where(or_(
+            User.username.in_(usernames), User.email.in_(emails)
+        ))
+        for username, email in await session.execute(query):
+            taken_usernames.add(username)
+            taken_emails.add(email)
+
+    for index, body in list(valid.items()):
+        detail = None
+        if body.username in taken_usernames:
+            detail = USERNAME_TAKEN
+        elif body.email in taken_emails:
+            detail = EMAIL_TAKEN
+        # повторы внутри самой пачки
+        taken_usernames.add(body.username)
+        taken_emails.add(body.email)
+        if detail is not None:
+            del valid[index]
+            results.append(BulkUserResult(
+                index=index, status="error", detail=detail
+            ))
+
+    if valid:
+        passwords = await hashing_service.hash_passwords(
+            [body.password for body in valid.values()]
+        )
+        now = datetime.datetime.utcnow()
+        users, salaries = [], []
+        for (index, body), password in zip(valid.items(), passwords):
+            user_id = uuid.uuid4()
+            users.append({
+                "id": user_id,
+                "username": body.username,
+                "email": body.email,
+                "password": password,
+                "first_name": body.first_name,
+                "last_name": body.last_name,
+                "role": "user",
+                "created_date": now,
+            })
+            salaries.append({
+                "id": uuid.uuid4(), "user_id": user_id, "created_date": now,
+            })
+            results.append(BulkUserResult(
+                index=index, status="created", id=user_id
+            ))
+        try:
+            await session.execute(insert(User), users)
+            await session.execute(insert(Salary), salaries)
+        except IntegrityError:
+            raise HTTPException(
+                status_code=409,
+                detail="Пользователи были изменены во время загрузки, "
+                       "повторите запрос"
+            )
+        after_commit(session, response_cache.invalidate)
+
+    return sorted(results, key=lambda result: result.index)
 
 
 async def authenticate_user_action(
@@ -66,26 +287,30 @@ async def authenticate_user_action(
     Проверяем существует ли пользователь с данным логином и паролем
     """
 
-    async with session.begin():
-        query = select(User).where(User.username == username)
-        user = await session.scalar(query)
-        if user is None:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Пользователь с {username} не найден"
-            )
-        elif Hasher.verify_password(password, user.password):
-            return user
+    user = await get_user_by_username_action(
+        username=username, session=session
+    )
+    if user is None:
         raise HTTPException(
-            status_code=401,
-            detail=f"Некорректный пароль для пользователя {username}"
+            status_code=404,
+            detail=f"Пользователь с {username} не найден"
         )
+    # транзакция завершается до проверки пароля, чтобы не держать
+    # соединение с БД во время работы bcrypt
+    await session.commit()
+    if await hashing_service.verify_password(password, user.password):
+        return user
+    raise HTTPException(
+        status_code=401,
+        detail=f"Некорректный пароль для пользователя {username}"
+    )
 
 
 async def get_current_user_from_token(
         token: str = Depends(oauth2_scheme),
         session: AsyncSession = Depends(get_session),
-) -> User | HTTPException:
+        read_session: AsyncSession = Depends(get_read_session),
+) -> User | Principal | HTTPException:
     """
     Получаем текущего пользователя по токену
     """
@@ -96,75 +321,245 @@ async def get_current_user_from_token(
     )
 
     try:
-        payload = jwt.decode(
-            token=token,
-            key=SECRET_KEY,
-            algorithms=ALGORITHM
-        )
+        payload = decode_access_token(token)
         user_id = payload.get("sub")
         if user_id is None:
             raise exception
-    except JWTError:
+    except InvalidToken:
         raise exception
 
-    user = await get_user_by_uuid_action(id=user_id, session=session)
+    if AUTH_MODE == "stateless":
+        return await get_principal_from_payload(
+            payload=payload, session=session, exception=exception
+        )
+
+    user = principal_cache.get(user_id)
+    if user is not None:
+        return user
+
+    user = await get_user_by_uuid_action(id=user_id, session=read_session)
+    if user is None and read_session.bind is not session.bind:
+        # реплика могла еще не получить только что созданного пользователя
+        user = await get_user_by_uuid_action(id=user_id, session=session)
     if user is None:
         raise exception
+    principal_cache.set(user_id, user)
     return user
 
 
-async def get_users_action(session: AsyncSession) -> list[User]:
+async def get_principal_from_payload(
+        payload: dict,
+        session: AsyncSession,
+        exception: HTTPException
+) -> Principal | HTTPException:
     """
-    Получение всех пользователей
+    Получаем пользователя из данных токена, сверяя только версию токена
     """
 
-    async with session.begin():
-        query = select(User)
-        users = await session.scalars(query)
-        return users
+    role = payload.get("role")
+    version = payload.get("ver")
+    if role is None or version is None:
+        raise exception
+    try:
+        user_id = uuid.UUID(payload["sub"])
+    except ValueError:
+        raise exception
+
+    if not await token_versions.is_current(
+        user_id=user_id, version=version, session=session
+    ):
+        raise exception
+    return Principal(id=user_id, role=role)
 
 
-async def delete_user_action(id: uuid.UUID, session: AsyncSession) -> None:
+async def revoke_user_tokens_action(
+        id: uuid.UUID,
+        session: AsyncSession
+) -> None | HTTPException:
     """
-    Удаление пользователя
+    Отзыв всех выданных пользователю токенов
     """
 
-    async with session.begin():
-        query = delete(User).where(User.id == id).returning(User)
-        user = await session.scalar(query)
-        if user is None:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Пользователь с uuid {id} не найден"
-            )
+    query = (
+        update(User)
+        .where(User.id == id)
+        .values(token_version=token_version_seq.next_value())
+        .returning(User.id)
+    )
+    user_id = await session.scalar(query)
+    if user_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Пользователь с uuid {id} не найден"
+        )
+    forget_user_after_commit(user_id=id, session=session)
+
+
+async def create_refresh_token_action(
+        user: User,
+        session: AsyncSession
+) -> str:
+    """
+    Выпуск refresh токена, в БД сохраняется только его хеш
+    """
+
+    now = datetime.datetime.utcnow()
+    expires_at = now + datetime.timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    token_id = uuid.uuid4()
+    token = create_refresh_token(data={
+        "jti": str(token_id), "sub": str(user.id),
+        "role": user.role, "ver": user.token_version,
+        "exp": calendar.timegm(expires_at.utctimetuple()),
+    })
+    await session.execute(insert(RefreshToken).values(
+        id=token_id,
+        user_id=user.id,
+        token_hash=hash_refresh_token(token),
+        expires_at=expires_at,
+        created_date=now
+    ))
+    return token
+
 
+async def refresh_access_token_action(
+        refresh_token: str,
+        session: AsyncSession
+) -> dict | HTTPException:
+    """
+    Данные для нового токена по refresh токену.
 
-async def check_unique_username_and_email(
-    body: CreateUser,
-    session: AsyncSession,
+    Проверяются подпись, срок, версия токенов пользователя и фильтр
+    отозванных токенов - все в памяти, без bcrypt и, как правило, без БД
+    """
+
+    exception = HTTPException(
+        status_code=401,
+        detail="Невалидный refresh токен"
+    )
+
+    data = decode_refresh_token(refresh_token)
+    if data is None:
+        raise exception
+    try:
+        user_id = uuid.UUID(data["sub"])
+        token_id = uuid.UUID(data["jti"])
+    except (KeyError, ValueError):
+        raise exception
+
+    if not await token_versions.is_current(
+        user_id=user_id, version=data["ver"], session=session
+    ):
+        raise exception
+    if await refresh_token_revocations.is_revoked(
+        token_id=token_id, session=session
+    ):
+        raise exception
+    return {"sub": data["sub"], "role": data["role"], "ver": data["ver"]}
+
+
+async def revoke_refresh_token_action(
+        refresh_token: str,
+        session: AsyncSession
 ) -> None | HTTPException:
     """
-    Проверка является ли username и email пользователя уникальными
+    Отзыв одного refresh токена
     """
 
-    if "admin" == body.username or "admin@admin.ru" == body.email:
+    query = select(RefreshToken.id, RefreshToken.expires_at).where(
+        RefreshToken.token_hash == hash_refresh_token(refresh_token)
+    )
+    token = (await session.execute(query)).one_or_none()
+    if token is None:
         raise HTTPException(
-            status_code=422,
-            detail="Недопустимые данные"
+            status_code=404,
+            detail="Refresh токен не найден"
         )
+    await session.execute(insert(RefreshTokenRevocation).values(
+        token_id=token.id,
+        expires_at=token.expires_at
+    ))
+    after_commit(session, lambda: refresh_token_revocations.add(token.id))
 
-    async with session.begin():
-        query_username = select(User).where(User.username == body.username)
-        query_email = select(User).where(User.email == body.email)
-        user_with_username = await session.scalar(query_username)
-        user_with_email = await session.scalar(query_email)
-    if user_with_username:
+
+def users_page_query(
+        after: tuple[datetime.datetime, uuid.UUID] | None,
+        limit: int | None
+) -> Select:
+    """
+    Запрос пользователей в порядке (created_date, id) начиная после курсора
+    """
+
+    query = select(User).order_by(User.created_date, User.id)
+    if after is not None:
+        query = query.where(tuple_(User.created_date, User.id) > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def get_users_action(
+        session: AsyncSession,
+        limit: int,
+        after: tuple[datetime.datetime, uuid.UUID] | None = None
+) -> list[User]:
+    """
+    Получение страницы пользователей
+    """
+
+    users = await session.scalars(users_page_query(after, limit))
+    return users.all()
+
+
+async def stream_users_action(
+        session: AsyncSession,
+        limit: int | None = None,
+        after: tuple[datetime.datetime, uuid.UUID] | None = None
+) -> AsyncIterator[User]:
+    """
+    Потоковое получение пользователей через серверный курсор
+    """
+
+    query = users_page_query(after, limit).execution_options(
+        yield_per=STREAM_FETCH_SIZE
+    )
+    users = await session.stream_scalars(query)
+    async for user in users:
+        yield user
+
+
+async def delete_user_action(id: uuid.UUID, session: AsyncSession) -> None:
+    """
+    Удаление пользователя
+    """
+
+    query = delete(User).where(User.id == id).returning(User.id)
+    user_id = await session.scalar(query)
+    if user_id is None:
         raise HTTPException(
-            status_code=422,
-            detail="Пользователь с данным username уже существует"
+            status_code=404,
+            detail=f"Пользователь с uuid {id} не найден"
         )
-    elif user_with_email:
+    forget_user_after_commit(user_id=id, session=session)
+    after_commit(session, lambda: response_cache.invalidate(id))
+
+
+def constraint_name(error: IntegrityError) -> str | None:
+    """
+    Имя ограничения, нарушение которого вызвало ошибку
+    """
+
+    return getattr(error.orig.__cause__, "constraint_name", None)
+
+
+def check_reserved_username_and_email(
+        body: CreateUser
+) -> None | HTTPException:
+    """
+    Проверка, что username и email не заняты администратором
+    """
+
+    if "admin" == body.username or "admin@admin.ru" == body.email:
         raise HTTPException(
             status_code=422,
-            detail="Пользователь с данным email уже существует"
+            detail="Недопустимые данные"
         )
@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from api.actions.user_actions import get_current_user_from_token
+from db.models import User
+from db.replicas import replica_engines, replica_pool_stats, replica_router
+from db.session import engine, get_pool_stats, pool_stats
+from utils.decorators import admin_required
+from utils.metrics import CONTENT_TYPE, registry
+from utils.tokens import token_codec
+from utils.warmup import readiness
+
+
+internal_router = APIRouter()
+metrics_router = APIRouter()
+health_router = APIRouter()
+jwks_router = APIRouter()
+
+
+@metrics_router.get("/metrics")
+async def get_metrics() -> PlainTextResponse:
+    """
+    Обработчик эндпоинта метрик в текстовом формате Prometheus
+    """
+
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+
+@health_router.get("/live")
+async def live() -> dict:
+    """
+    Обработчик эндпоинта проверки, что процесс жив
+    """
+
+    return {"status": "alive"}
+
+
+@health_router.get("/ready")
+async def ready() -> JSONResponse:
+    """
+    Обработчик эндпоинта готовности: 503, пока идет прогрев
+    """
+
+    return JSONResponse(
+        readiness.as_dict(), status_code=200 if readiness.ready else 503
+    )
+
+
+@jwks_router.get("/.well-known/jwks.json")
+async def get_jwks() -> dict:
+    """
+    Обработчик эндпоинта открытых ключей для проверки токенов другими
+    сервисами. При подписи HS256 список пуст
+    """
+
+    return token_codec.jwks()
+
+
+@internal_router.get("/db-pool/")
+@admin_required
+async def get_db_pool_stats(
+    current_user: User = Depends(get_current_user_from_token),
+) -> dict:
+    """
+    Обработчик эндпоинта получения состояния пула соединений с БД
+    """
+
+    stats = get_pool_stats(engine=engine, stats=pool_stats)
+    stats["replicas"] = [
+        get_pool_stats(engine=replica, stats=replica_stats)
+        for replica, replica_stats in zip(replica_engines, replica_pool_stats)
+    ]
+    stats["routing"] = replica_router.stats()
+    return stats
@@ -1,25 +1,129 @@
+import datetime
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response
+)
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.actions.salary_actions import update_user_salary_action
+from api.actions.salary_actions import (
+    get_salary_by_user_id_action,
+    get_salary_history_action,
+    get_salary_stats_action,
+    get_salary_version_action,
+    stream_salary_export_action,
+    update_salaries_bulk_action,
+    update_user_salary_action
+)
 from api.actions.user_actions import (
     get_current_user_from_token,
     get_user_by_uuid_action
 )
-from api.schemas import GetSalary, GetUser, UpdateSalary
-from db.models import User
+from api.schemas import (
+    BulkUpdateSalary,
+    BulkUpdateSalaryResult,
+    GetSalary,
+    GetSalaryHistory,
+    GetSalaryStats,
+    GetUser,
+    UpdateSalary
+)
+from db.models import Salary, User
+from db.replicas import get_read_session, replica_router
 from db.session import get_session
+from settings import BULK_MAX_SIZE, PAGE_MAX_SIZE, PAGE_SIZE
 from utils.decorators import admin_required
+from utils.etag import etag_matches, not_modified, salary_etag
+from utils.export import (
+    EXPORT_FORMATS,
+    accepts_gzip,
+    encode_export,
+    gzip_stream
+)
+from utils.pagination import decode_cursor, encode_cursor
+from utils.response_cache import response_cache
+from utils.security import Principal
+from utils.serialization import (
+    negotiate,
+    salary_history_to_dict,
+    salary_to_dict,
+    serialize_response,
+    user_to_dict
+)
 
 
 salary_router = APIRouter()
 
 
+def salary_response(request: Request, salary: Salary) -> Response:
+    """
+    Зарплата с ETag или 304, если у клиента та же версия
+    """
+
+    etag = salary_etag(salary.id, salary.version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return serialize_response(
+        request, salary_to_dict(salary), headers={"ETag": etag}
+    )
+
+
+async def salary_not_modified(
+        request: Request,
+        user_id: uuid.UUID,
+        session: AsyncSession
+) -> Response | None:
+    """
+    Ответ 304 на условный запрос по одной версии зарплаты, без загрузки
+    пользователя и самой зарплаты. None, если нужен полный ответ
+    """
+
+    if "if-none-match" not in request.headers:
+        return None
+    version = await get_salary_version_action(
+        user_id=user_id, session=session
+    )
+    if version is None:
+        return None
+    etag = salary_etag(*version)
+    return not_modified(etag) if etag_matches(request, etag) else None
+
+
+@salary_router.patch("/bulk/", response_model=BulkUpdateSalaryResult)
+@admin_required
+async def update_salaries_bulk(
+    body: list[BulkUpdateSalary] = Body(..., max_items=BULK_MAX_SIZE),
+    atomic: bool = False,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """
+    Обработчик эндпоинта массового обновления зарплат.
+    При atomic=true изменения применяются только если найдены все
+    пользователи
+    """
+
+    updated, missing = await update_salaries_bulk_action(
+        items=body, atomic=atomic, session=session
+    )
+    await session.commit()
+    replica_router.mark_write(
+        current_user.id, *(item.user_id for item in body)
+    )
+    return BulkUpdateSalaryResult(updated=updated, missing=missing)
+
+
 @salary_router.patch("/{user_id}/", response_model=GetUser)
 @admin_required
 async def update_salary(
+    request: Request,
     user_id: uuid.UUID,
     body: UpdateSalary,
     session: AsyncSession = Depends(get_session),
@@ -32,35 +136,168 @@ async def update_salary(
     user = await update_user_salary_action(
         user_id=user_id, body=body, session=session
     )
-    return GetUser.from_orm(user)
+    await session.commit()
+    # какое-то время и автор изменения, и сам пользователь читают
+    # из основной БД, чтобы сразу увидеть новые данные
+    replica_router.mark_write(current_user.id, user_id)
+    return serialize_response(request, user_to_dict(user))
 
 
 @salary_router.get("/me/", response_model=GetSalary)
 async def get_salary_current_user(
+    request: Request,
+    session: AsyncSession = Depends(get_read_session),
+    current_user: User | Principal = Depends(get_current_user_from_token),
+):
+    """
+    Обработчик эндпоинта получения данных о зарплате пользователя.
+    Поддерживает условные запросы по ETag
+    """
+
+    if isinstance(current_user, User):
+        return salary_response(request, current_user.salary)
+    # в stateless режиме пользователь не загружается, берем только зарплату
+    response = await salary_not_modified(
+        request=request, user_id=current_user.id, session=session
+    )
+    if response is not None:
+        return response
+    salary = await get_salary_by_user_id_action(
+        user_id=current_user.id, session=session
+    )
+    return salary_response(request, salary)
+
+
+@salary_router.get("/stats/", response_model=GetSalaryStats)
+@admin_required
+async def get_salary_stats(
+    request: Request,
+    months: int = Query(12, ge=1, le=120),
+    session: AsyncSession = Depends(get_read_session),
     current_user: User = Depends(get_current_user_from_token),
 ):
     """
-    Обработчик эндпоинта получения данных о зарплате пользователя
+    Обработчик эндпоинта сводки по зарплатам: сумма, среднее,
+    приближенные перцентили и количество повышений по месяцам
+    """
+
+    cache_key = (months, negotiate(request))
+    response = response_cache.get("salary_stats", cache_key)
+    if response is not None:
+        return response
+
+    stamp = response_cache.stamp()
+    stats = await get_salary_stats_action(session=session, months=months)
+    response = serialize_response(request, stats)
+    response_cache.set("salary_stats", cache_key, response, stamp)
+    return response
+
+
+@salary_router.get("/export/")
+@admin_required
+async def export_salaries(
+    request: Request,
+    export_format: str = Query("csv", alias="format", regex="^(csv|ndjson)$"),
+    session: AsyncSession = Depends(get_read_session),
+    current_user: User = Depends(get_current_user_from_token),
+) -> StreamingResponse:
+    """
+    Обработчик эндпоинта выгрузки всех зарплат в CSV или NDJSON.
+
+    Строки читаются из серверного курсора и отправляются кусками по мере
+    кодирования (chunked), при Accept-Encoding: gzip поток сжимается на
+    лету. Память на запрос не зависит от количества сотрудников
     """
 
-    return GetSalary.from_orm(current_user.salary)
+    chunks = encode_export(
+        stream_salary_export_action(session=session), export_format
+    )
+    headers = {
+        "Content-Disposition":
+            f'attachment; filename="salaries.{export_format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if accepts_gzip(request):
+        chunks = gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        chunks, media_type=EXPORT_FORMATS[export_format], headers=headers
+    )
 
 
 @salary_router.get("/{user_id}/", response_model=GetSalary)
 @admin_required
 async def get_salary_user(
+    request: Request,
     user_id: uuid.UUID,
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     current_user: User = Depends(get_current_user_from_token),
 ):
     """
-    Обработчик эндпоинта получения зарплаты определенного пользователя
+    Обработчик эндпоинта получения зарплаты определенного пользователя.
+    Поддерживает условные запросы по ETag, готовый ответ кешируется
+    до изменения зарплаты
     """
 
+    cache_key = (user_id, negotiate(request))
+    response = response_cache.get("salary_user", cache_key)
+    if response is not None:
+        etag = response.headers["etag"]
+        return not_modified(etag) if etag_matches(request, etag) else response
+
+    stamp = response_cache.stamp()
+    response = await salary_not_modified(
+        request=request, user_id=user_id, session=session
+    )
+    if response is not None:
+        return response
     user = await get_user_by_uuid_action(id=user_id, session=session)
     if user is None:
         raise HTTPException(
             status_code=404,
             detail=f"Пользователь с uuid {user_id} не найден"
         )
-    return GetSalary.from_orm(user.salary)
+    response = salary_response(request, user.salary)
+    if response.status_code == 200:
+        response_cache.set(
+            "salary_user", cache_key, response, stamp, user_id=user_id
+        )
+    return response
+
+
+@salary_router.get(
+    "/{user_id}/history/", response_model=list[GetSalaryHistory]
+)
+@admin_required
+async def get_salary_history(
+    request: Request,
+    user_id: uuid.UUID,
+    date_from: datetime.datetime | None = Query(None, alias="from"),
+    date_to: datetime.datetime | None = Query(None, alias="to"),
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_MAX_SIZE),
+    cursor: str | None = None,
+    session: AsyncSession = Depends(get_read_session),
+    current_user: User = Depends(get_current_user_from_token),
+):
+    """
+    Обработчик эндпоинта получения истории зарплаты пользователя.
+    Курсор следующей страницы передается в заголовке X-Next-Cursor
+    """
+
+    history = await get_salary_history_action(
+        user_id=user_id,
+        session=session,
+        limit=limit,
+        date_from=date_from,
+        date_to=date_to,
+        after=decode_cursor(cursor) if cursor is not None else None
+    )
+    headers = {}
+    if len(history) == limit:
+        last = history[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.effective_date, last.id)
+    return serialize_response(
+        request,
+        [salary_history_to_dict(record) for record in history],
+        headers=headers
+    )
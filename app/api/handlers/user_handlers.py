@@ -1,28 +1,63 @@
 import uuid
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.actions.user_actions import (
     authenticate_user_action,
+    create_refresh_token_action,
     create_user_action,
+    create_users_bulk_action,
     delete_user_action,
     get_current_user_from_token,
-    get_users_action
+    get_users_action,
+    refresh_access_token_action,
+    revoke_refresh_token_action,
+    revoke_user_tokens_action,
+    stream_users_action
+)
+from api.schemas import (
+    BulkCreateUsersResult,
+    CreateUser,
+    GetToken,
+    GetUser,
+    RefreshAccessToken
 )
-from api.schemas import CreateUser, GetToken, GetUser
 from db.models import User
+from db.replicas import get_read_session
 from db.session import get_session
-from settings import ACCESS_TOKEN_EXPIRE_MINUTES
+from settings import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    BULK_MAX_SIZE,
+    PAGE_MAX_SIZE,
+    PAGE_SIZE
+)
 from utils.decorators import admin_required
+from utils.pagination import decode_cursor, encode_cursor
+from utils.rate_limit import login_guard
+from utils.response_cache import response_cache
 from utils.security import create_access_token
+from utils.serialization import (
+    NDJSON,
+    dumps_line,
+    negotiate,
+    serialize_response,
+    user_to_dict
+)
 
 
 user_router = APIRouter()
 
 
+async def issue_access_token(claims: dict) -> str:
+    expire_time = datetime.utcnow() + timedelta(
+        minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return await create_access_token(data={**claims, "exp": expire_time})
+
+
 @user_router.post("/", response_model=GetUser, status_code=201)
 async def create_user(
     body: CreateUser,
@@ -33,49 +68,150 @@ async def create_user(
     """
 
     user = await create_user_action(body=body, session=session)
+    await session.commit()
 
     return GetUser.from_orm(user)
 
 
+@user_router.post("/bulk/", response_model=BulkCreateUsersResult)
+@admin_required
+async def create_users_bulk(
+    body: list[dict] = Body(..., max_items=BULK_MAX_SIZE),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user_from_token),
+):
+    """
+    Обработчик эндпоинта для массового создания пользователей
+    """
+
+    results = await create_users_bulk_action(rows=body, session=session)
+    await session.commit()
+    created = sum(result.status == "created" for result in results)
+    return BulkCreateUsersResult(
+        created=created,
+        failed=len(results) - created,
+        results=results
+    )
+
+
 @user_router.post("/token/", response_model=GetToken)
 async def get_token(
+    request: Request,
     body: OAuth2PasswordRequestForm = Depends(),
     session: AsyncSession = Depends(get_session),
 ):
     """
-    Обработчик эндпоинта для получения токена
+    Обработчик эндпоинта для получения токена.
+    При перегрузке или превышении лимита попыток отвечает 429
+    до обращения к БД и bcrypt
     """
 
+    login_guard.check(
+        username=body.username,
+        ip=request.client.host if request.client else None
+    )
     user = await authenticate_user_action(
         body.username,
         body.password,
         session=session
     )
 
-    expire_time = datetime.utcnow() + timedelta(
-        minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    data = {
-        "sub": str(user.id), "exp": expire_time,
-    }
+    access_token = await issue_access_token({
+        "sub": str(user.id), "role": user.role, "ver": user.token_version,
+    })
+    refresh_token = await create_refresh_token_action(
+        user=user, session=session
+    )
+    await session.commit()
+    return GetToken(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=refresh_token
+    )
+
+
+@user_router.post("/token/refresh/", response_model=GetToken)
+async def refresh_token(
+    body: RefreshAccessToken,
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Обработчик эндпоинта для получения нового токена по refresh токену
+    """
 
-    access_token = await create_access_token(
-        data=data
+    claims = await refresh_access_token_action(
+        refresh_token=body.refresh_token, session=session
+    )
+    access_token = await issue_access_token(claims)
+    return GetToken(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=body.refresh_token
     )
-    return GetToken(access_token=access_token, token_type="bearer")
+
+
+@user_router.post("/token/revoke/", status_code=204)
+async def revoke_refresh_token(
+    body: RefreshAccessToken,
+    session: AsyncSession = Depends(get_session),
+) -> None:
+    """
+    Обработчик эндпоинта для отзыва refresh токена
+    """
+
+    await revoke_refresh_token_action(
+        refresh_token=body.refresh_token, session=session
+    )
+    await session.commit()
 
 
 @user_router.get("/", response_model=list[GetUser])
 @admin_required
 async def get_users(
-    session: AsyncSession = Depends(get_session),
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=PAGE_MAX_SIZE),
+    cursor: str | None = None,
+    session: AsyncSession = Depends(get_read_session),
     current_user: User = Depends(get_current_user_from_token),
 ):
     """
-    Обработчик эндпоинта для получения пользователей
+    Обработчик эндпоинта для получения пользователей.
+
+    Отдает страницу пользователей, курсор следующей страницы передается
+    в заголовке X-Next-Cursor. При Accept: application/x-ndjson
+    пользователи стримятся построчно без ограничения на размер страницы,
+    при Accept: application/msgpack страница отдается в msgpack.
+    Готовые страницы кешируются до изменения пользователей или зарплат.
     """
 
-    users = await get_users_action(session=session)
-    return [GetUser.from_orm(user) for user in users]
+    after = decode_cursor(cursor) if cursor is not None else None
+
+    if NDJSON in request.headers.get("accept", ""):
+        async def rows():
+            async for user in stream_users_action(
+                session=session, limit=limit, after=after
+            ):
+                yield dumps_line(user_to_dict(user))
+
+        return StreamingResponse(rows(), media_type=NDJSON)
+
+    limit = limit or PAGE_SIZE
+    cache_key = (negotiate(request), limit, after)
+    response = response_cache.get("users", cache_key)
+    if response is not None:
+        return response
+
+    stamp = response_cache.stamp()
+    users = await get_users_action(session=session, limit=limit, after=after)
+    headers = {}
+    if len(users) == limit:
+        last = users[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.created_date, last.id)
+    response = serialize_response(
+        request, [user_to_dict(user) for user in users], headers=headers
+    )
+    response_cache.set("users", cache_key, response, stamp)
+    return response
 
 
 @user_router.delete("/{user_id}/", status_code=204)
@@ -90,3 +226,19 @@ async def delete_user(
     """
 
     await delete_user_action(id=user_id, session=session)
+    await session.commit()
+
+
+@user_router.post("/{user_id}/revoke-tokens/", status_code=204)
+@admin_required
+async def revoke_user_tokens(
+    user_id: uuid.UUID,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user_from_token)
+) -> None:
+    """
+    Обработчик эндпоинта для отзыва всех токенов пользователя
+    """
+
+    await revoke_user_tokens_action(id=user_id, session=session)
+    await session.commit()
@@ -1,6 +1,7 @@
 import datetime
 import re
 import uuid
+from typing import Any, Literal
 
 from fastapi import HTTPException
 from pydantic import BaseModel, EmailStr, validator
@@ -68,6 +69,20 @@ class GetSalary(BaseModel):
         orm_mode = True
 
 
+class GetSalaryHistory(BaseModel):
+    """
+    Запись истории изменения зарплаты
+    """
+
+    id: uuid.UUID
+    current_salary: float | None
+    increase_date: datetime.datetime | None
+    effective_date: datetime.datetime
+
+    class Config:
+        orm_mode = True
+
+
 class GetUser(BaseModel):
     """
     Получение пользователя с информацией о зарплате
@@ -85,6 +100,27 @@ class GetUser(BaseModel):
         orm_mode = True
 
 
+class BulkUserResult(BaseModel):
+    """
+    Результат создания одного пользователя из пачки
+    """
+
+    index: int
+    status: Literal["created", "error"]
+    id: uuid.UUID | None
+    detail: Any = None
+
+
+class BulkCreateUsersResult(BaseModel):
+    """
+    Отчет о массовом создании пользователей
+    """
+
+    created: int
+    failed: int
+    results: list[BulkUserResult]
+
+
 class GetToken(BaseModel):
     """
     Получение токена
@@ -92,6 +128,15 @@ class GetToken(BaseModel):
 
     access_token: str
     token_type: str
+    refresh_token: str | None = None
+
+
+class RefreshAccessToken(BaseModel):
+    """
+    Refresh токен для получения нового токена или отзыва
+    """
+
+    refresh_token: str
 
 
 class UpdateSalary(BaseModel):
@@ -101,3 +146,46 @@ class UpdateSalary(BaseModel):
 
     current_salary: float | None
     increase_date: datetime.datetime | None
+
+
+class BulkUpdateSalary(UpdateSalary):
+    """
+    Обновление информации о зарплате одного пользователя из пачки
+    """
+
+    user_id: uuid.UUID
+
+
+class BulkUpdateSalaryResult(BaseModel):
+    """
+    Отчет о массовом обновлении зарплат
+    """
+
+    updated: int
+    missing: list[uuid.UUID]
+
+
+class SalaryRaises(BaseModel):
+    """
+    Количество повышений зарплаты в месяце
+    """
+
+    month: datetime.datetime
+    raises: int
+
+
+class GetSalaryStats(BaseModel):
+    """
+    Сводка по зарплатам. Перцентили приближенные, с относительной
+    погрешностью relative_accuracy
+    """
+
+    count: int
+    total: float
+    average: float | None
+    p50: float | None
+    p90: float | None
+    p95: float | None
+    p99: float | None
+    relative_accuracy: float
+    upcoming_raises: list[SalaryRaises]
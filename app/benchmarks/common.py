@@ -0,0 +1,171 @@
+import asyncio
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Salary, User
+from db.session import async_session
+from settings import ACCESS_TOKEN_EXPIRE_MINUTES
+from utils.hashing import Hasher
+from utils.security import create_access_token
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Перцентиль q (0..1) по списку значений
+    """
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(len(ordered) * q))
+    return ordered[index]
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    """
+    Сводка по задержкам в миллисекундах
+    """
+
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def seed_user(username: str, password: str, role: str = "user") -> User:
+    """
+    Создаем (или находим) пользователя для бенчмарка
+    """
+
+    session: AsyncSession = async_session()
+    async with session.begin():
+        user = await session.scalar(
+            select(User).where(User.username == username)
+        )
+        if user is None:
+            user = User(
+                username=username,
+                email=f"{username}@bench.ru",
+                password=Hasher.hash_password(password),
+                first_name="Бенч",
+                last_name="Бенчев",
+                role=role
+            )
+            salary = Salary()
+            salary.user = user
+            session.add(user)
+            session.add(salary)
+    await session.close()
+    return user
+
+
+async def seed_users(
+        prefix: str,
+        count: int,
+        password: str
+) -> list[tuple[uuid.UUID, str]]:
+    """
+    Создаем недостающих пользователей prefix0..prefix{count-1} с зарплатами,
+    возвращаем их id и username
+    """
+
+    usernames = [f"{prefix}{number}" for number in range(count)]
+    # у всех пользователей один пароль, bcrypt считается один раз
+    hashed = Hasher.hash_password(password)
+    session: AsyncSession = async_session()
+    async with session.begin():
+        existing = set(await session.scalars(
+            select(User.username).where(User.username.in_(usernames))
+        ))
+        now = datetime.utcnow()
+        users, salaries = [], []
+        for username in usernames:
+            if username in existing:
+                continue
+            user_id = uuid.uuid4()
+            users.append({
+                "id": user_id,
+                "username": username,
+                "email": f"{username}@bench.ru",
+                "password": hashed,
+                "first_name": "Бенч",
+                "last_name": "Бенчев",
+                "role": "user",
+                "created_date": now,
+            })
+            salaries.append({
+                "id": uuid.uuid4(),
+                "user_id": user_id,
+                "current_salary": float(random.randint(50000, 300000)),
+                "created_date": now,
+            })
+        if users:
+            await session.execute(insert(User), users)
+            await session.execute(insert(Salary), salaries)
+        rows = await session.execute(
+            select(User.id, User.username).where(User.username.in_(usernames))
+        )
+        seeded = [(user_id, username) for user_id, username in rows]
+    await session.close()
+    return seeded
+
+
+async def auth_headers(user: User) -> dict:
+    expire_time = datetime.utcnow() + timedelta(
+        minutes=ACCESS_TOKEN_EXPIRE_MINUTES
+    )
+    token = await create_access_token(data={
+        "sub": str(user.id), "exp": expire_time,
+        "role": user.role, "ver": user.token_version,
+    })
+    return {"Authorization": f"bearer {token}"}
+
+
+# строка метрики db_queries_per_request_sum / _count из /metrics
+DB_QUERIES_SAMPLE = re.compile(
+    r"^db_queries_per_request_(sum|count)\{[^}]*\} (\S+)$", re.MULTILINE
+)
+
+
+def db_queries_totals(metrics: str) -> tuple[float, float]:
+    """
+    Суммарное количество запросов к БД и HTTP запросов по тексту /metrics
+    """
+
+    totals = {"sum": 0.0, "count": 0.0}
+    for kind, value in DB_QUERIES_SAMPLE.findall(metrics):
+        totals[kind] += float(value)
+    return totals["sum"], totals["count"]
+
+
+async def timed(latencies: list[float], coro) -> None:
+    started = time.perf_counter()
+    await coro
+    latencies.append(time.perf_counter() - started)
+
+
+async def run_concurrently(count: int, concurrency: int, make_request):
+    """
+    Выполняет count запросов не более чем в concurrency параллельных задачах,
+    возвращает задержки и общее время
+    """
+
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker():
+        async with semaphore:
+            await timed(latencies, make_request())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(count)))
+    return latencies, time.perf_counter() - started
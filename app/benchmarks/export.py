@@ -0,0 +1,137 @@
+"""
+Бенчмарк выгрузки зарплат GET /salary/export/.
+
+Создает недостающих пользователей (по умолчанию миллион) и выгружает
+их в CSV и NDJSON, без сжатия и с gzip. Для каждого варианта выводятся
+время, скорость в строках в секунду, объем и пик памяти Python
+(tracemalloc): он не должен расти с количеством строк.
+
+Без --url замеряется сам конвейер обработчика (курсор, кодирование,
+gzip) без HTTP: ASGITransport httpx собирает ответ целиком в памяти
+и исказил бы замер памяти. С --url выгрузка идет по HTTP с запущенного
+сервера и читается потоком.
+
+Запуск (из директории app/, нужна настроенная БД):
+    python -m benchmarks.export --users 1000000
+    python -m benchmarks.export --url http://localhost:80
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from typing import AsyncIterator
+
+from httpx import AsyncClient
+
+from api.actions.salary_actions import stream_salary_export_action
+from benchmarks.common import auth_headers, seed_user, seed_users
+from db.session import async_session
+from utils.export import encode_export, gzip_stream
+from utils.hashing import hashing_service
+
+
+BENCH_PREFIX = "benchexport"
+BENCH_PASSWORD = "benchexport"
+BENCH_ADMIN = "benchexportadmin"
+# пользователи создаются пачками: один запрос не вместит миллион
+# параметров
+SEED_BATCH_SIZE = 10000
+
+
+async def seed(count: int) -> None:
+    for start in range(0, count, SEED_BATCH_SIZE):
+        await seed_users(
+            f"{BENCH_PREFIX}{start // SEED_BATCH_SIZE}x",
+            min(SEED_BATCH_SIZE, count - start),
+            BENCH_PASSWORD
+        )
+
+
+async def in_process_chunks(
+        export_format: str,
+        gzip: bool
+) -> AsyncIterator[bytes]:
+    session = async_session()
+    try:
+        chunks = encode_export(
+            stream_salary_export_action(session=session), export_format
+        )
+        if gzip:
+            chunks = gzip_stream(chunks)
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await session.close()
+
+
+async def http_chunks(
+        client: AsyncClient,
+        headers: dict,
+        export_format: str,
+        gzip: bool
+) -> AsyncIterator[bytes]:
+    headers = {
+        **headers, "Accept-Encoding": "gzip" if gzip else "identity"
+    }
+    async with client.stream(
+        "GET", "/salary/export/", params={"format": export_format},
+        headers=headers
+    ) as response:
+        response.raise_for_status()
+        # байты в том виде, в котором пришли по сети
+        async for chunk in response.aiter_raw():
+            yield chunk
+
+
+async def measure(chunks: AsyncIterator[bytes], rows: int) -> dict:
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed else 0.0,
+        "megabytes": size / 2 ** 20,
+        "peak_python_memory_mb": peak / 2 ** 20,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    await seed(args.users)
+    headers = await auth_headers(
+        await seed_user(BENCH_ADMIN, BENCH_PASSWORD, role="admin")
+    )
+    rows = 0
+    async for chunk in in_process_chunks("ndjson", gzip=False):
+        rows += chunk.count(b"\n")
+
+    results = {"rows": rows}
+    async with AsyncClient(base_url=args.url or "", timeout=None) as client:
+        for export_format in ("csv", "ndjson"):
+            for gzip in (False, True):
+                if args.url:
+                    chunks = http_chunks(client, headers, export_format, gzip)
+                else:
+                    chunks = in_process_chunks(export_format, gzip)
+                name = f"{export_format}{'+gzip' if gzip else ''}"
+                results[name] = await measure(chunks, rows)
+
+    hashing_service.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--url", help="адрес запущенного сервера, по умолчанию - в процессе"
+    )
+    parser.add_argument("--users", type=int, default=1000000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""
+Бенчмарк влияния bcrypt на остальные эндпоинты.
+
+Измеряет задержки /salary/me/ сначала без нагрузки, а затем во время
+непрерывного потока логинов на /users/token/. При хешировании в пуле
+процессов p99 /salary/me/ должен оставаться примерно на том же уровне.
+
+Запуск (из директории app/, нужна настроенная БД):
+    python -m benchmarks.hashing --polls 500 --login-concurrency 32
+"""
+import argparse
+import asyncio
+import json
+
+from httpx import AsyncClient
+
+from benchmarks.common import (
+    auth_headers,
+    run_concurrently,
+    seed_user,
+    summarize
+)
+from main import app
+from utils.hashing import hashing_service
+from utils.rate_limit import login_guard
+
+
+BENCH_USERNAME = "benchhashing"
+BENCH_PASSWORD = "benchhashing"
+
+
+async def login_storm(client: AsyncClient, stop: asyncio.Event) -> int:
+    logins = 0
+    while not stop.is_set():
+        await client.post(
+            url="/users/token/",
+            data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD},
+        )
+        logins += 1
+    return logins
+
+
+async def main(args: argparse.Namespace) -> None:
+    user = await seed_user(BENCH_USERNAME, BENCH_PASSWORD)
+    # логины одного пользователя должны доходить до bcrypt
+    login_guard.ip_limiter.burst = float("inf")
+    login_guard.username_limiter.burst = float("inf")
+    headers = await auth_headers(user)
+
+    async with AsyncClient(app=app, base_url="http://bench") as client:
+        def poll():
+            return client.get("/salary/me/", headers=headers)
+
+        # прогрев
+        await run_concurrently(20, args.poll_concurrency, poll)
+
+        idle = summarize(*await run_concurrently(
+            args.polls, args.poll_concurrency, poll
+        ))
+
+        stop = asyncio.Event()
+        storm = [
+            asyncio.create_task(login_storm(client, stop))
+            for _ in range(args.login_concurrency)
+        ]
+        # даем очереди хеширования заполниться
+        await asyncio.sleep(0.5)
+        loaded = summarize(*await run_concurrently(
+            args.polls, args.poll_concurrency, poll
+        ))
+        stop.set()
+        logins = sum(await asyncio.gather(*storm))
+
+    hashing_service.shutdown()
+    print(json.dumps({
+        "salary_me_idle": idle,
+        "salary_me_during_logins": loaded,
+        "logins": logins,
+        "hashing": hashing_service.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--polls", type=int, default=300)
+    parser.add_argument("--poll-concurrency", type=int, default=8)
+    parser.add_argument("--login-concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,248 @@
+"""
+Нагрузочный бенчмарк API.
+
+Создает пользователей с зарплатами и прогоняет сценарии:
+    login       - поток логинов на /users/token/
+    salary_me   - опрос /salary/me/ пользователями
+    users_list  - получение /users/ администратором
+    raise_cycle - смешанная нагрузка: администратор меняет зарплаты
+                  (PATCH /salary/{user_id}/), пользователи читают свою
+
+Для каждого сценария выводятся RPS, p50/p95/p99 задержек, доля ошибок
+и среднее количество запросов к БД на HTTP запрос (по /metrics).
+Результаты можно сохранить в JSON и сравнить со старым прогоном.
+
+Запуск (из директории app/, нужна настроенная БД):
+    python -m benchmarks.load --users 1000 --requests 2000
+    python -m benchmarks.load --url http://localhost:80 --output run.json
+    python -m benchmarks.load --baseline run.json --tolerance 0.1
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+
+from httpx import ASGITransport, AsyncClient
+
+from benchmarks.common import (
+    db_queries_totals,
+    run_concurrently,
+    seed_user,
+    seed_users,
+    summarize
+)
+from main import app
+from utils.hashing import hashing_service
+from utils.rate_limit import login_guard
+
+
+BENCH_PREFIX = "benchload"
+BENCH_PASSWORD = "benchload"
+BENCH_ADMIN = "benchloadadmin"
+
+SCENARIOS = ("login", "salary_me", "users_list", "raise_cycle")
+
+
+async def login(client: AsyncClient, username: str) -> dict:
+    response = await client.post(
+        url="/users/token/",
+        data={"username": username, "password": BENCH_PASSWORD},
+    )
+    response.raise_for_status()
+    return {"Authorization": f"bearer {response.json()['access_token']}"}
+
+
+class LoadContext:
+    """
+    Пользователи и токены, общие для всех сценариев
+    """
+
+    def __init__(self, users: list, tokens: dict, admin_headers: dict):
+        self.users = users
+        self.tokens = tokens
+        self.admin_headers = admin_headers
+        self.errors = 0
+
+    async def check(self, request) -> None:
+        response = await request
+        if response.status_code >= 400:
+            self.errors += 1
+
+
+def make_scenario(name: str, client: AsyncClient, context: LoadContext):
+    """
+    Функция, создающая очередной запрос сценария
+    """
+
+    token_users = list(context.tokens)
+
+    def login_request():
+        _, username = random.choice(context.users)
+        return context.check(client.post(
+            url="/users/token/",
+            data={"username": username, "password": BENCH_PASSWORD},
+        ))
+
+    def salary_me_request():
+        user_id = random.choice(token_users)
+        return context.check(client.get(
+            url="/salary/me/", headers=context.tokens[user_id]
+        ))
+
+    def users_list_request():
+        return context.check(client.get(
+            url="/users/", params={"limit": 100},
+            headers=context.admin_headers
+        ))
+
+    def raise_cycle_request():
+        # каждый пятый запрос - повышение, остальные - чтение своей зарплаты
+        if random.random() < 0.2:
+            return context.check(client.patch(
+                url=f"/salary/{random.choice(token_users)}/",
+                json={"current_salary": random.randint(50000, 300000)},
+                headers=context.admin_headers
+            ))
+        return salary_me_request()
+
+    return {
+        "login": login_request,
+        "salary_me": salary_me_request,
+        "users_list": users_list_request,
+        "raise_cycle": raise_cycle_request,
+    }[name]
+
+
+async def run_scenario(
+        name: str,
+        client: AsyncClient,
+        context: LoadContext,
+        requests: int,
+        concurrency: int
+) -> dict:
+    make_request = make_scenario(name, client, context)
+    # прогрев
+    await run_concurrently(min(requests, 20), concurrency, make_request)
+
+    queries_before, count_before = db_queries_totals(
+        (await client.get("/metrics")).text
+    )
+    context.errors = 0
+    result = summarize(*await run_concurrently(
+        requests, concurrency, make_request
+    ))
+    queries_after, count_after = db_queries_totals(
+        (await client.get("/metrics")).text
+    )
+
+    handled = count_after - count_before
+    result["errors"] = context.errors
+    result["db_queries_per_request"] = (
+        (queries_after - queries_before) / handled if handled else 0.0
+    )
+    return result
+
+
+def find_regressions(
+        results: dict,
+        baseline: dict,
+        tolerance: float
+) -> list[str]:
+    """
+    Сценарии, в которых RPS упал или p99 вырос больше чем на tolerance
+    """
+
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: rps {result['rps']:.1f} < {base['rps']:.1f}"
+            )
+        if result["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p99 {result['p99_ms']:.1f}ms > "
+                f"{base['p99_ms']:.1f}ms"
+            )
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> int:
+    users = await seed_users(BENCH_PREFIX, args.users, BENCH_PASSWORD)
+    await seed_user(BENCH_ADMIN, BENCH_PASSWORD, role="admin")
+
+    if args.url:
+        client = AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        client = AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://bench",
+            timeout=args.timeout
+        )
+        if not args.login_limits:
+            # все запросы идут с одного адреса, лимиты логинов мешают
+            # измерять сам сервис
+            login_guard.ip_limiter.burst = float("inf")
+            login_guard.username_limiter.burst = float("inf")
+
+    results = {}
+    async with client:
+        admin_headers = await login(client, BENCH_ADMIN)
+        tokens = {}
+        for user_id, username in users[:args.token_users]:
+            tokens[user_id] = await login(client, username)
+        context = LoadContext(users, tokens, admin_headers)
+
+        for name in args.scenarios:
+            results[name] = await run_scenario(
+                name, client, context, args.requests, args.concurrency
+            )
+
+    hashing_service.shutdown()
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Регрессия: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--url", help="адрес запущенного uvicorn, по умолчанию - в процессе"
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--token-users", type=int, default=50,
+        help="сколько пользователей логинятся для опроса /salary/me/"
+    )
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument(
+        "--login-limits", action="store_true",
+        help="не отключать лимиты логинов при запуске в процессе"
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--baseline", help="JSON с результатами для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    sys.exit(asyncio.run(main(parser.parse_args())))
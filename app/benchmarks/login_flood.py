@@ -0,0 +1,138 @@
+"""
+Бенчмарк защиты /users/token/ от потока логинов.
+
+Имитирует подбор паролей: с attacker-ips адресов идут логины существующих
+пользователей с неверным паролем. Замеряются задержки /salary/me/ и /users/
+без нагрузки и во время потока, а также сколько логинов было отклонено
+(429), отвергнуто очередью bcrypt (503) и дошло до проверки пароля.
+
+Запуск (из директории app/, нужна настроенная БД):
+    python -m benchmarks.login_flood --polls 500 --attackers 64
+"""
+import argparse
+import asyncio
+import json
+import random
+from collections import Counter
+
+from httpx import ASGITransport, AsyncClient
+
+from benchmarks.common import (
+    auth_headers,
+    run_concurrently,
+    seed_user,
+    seed_users,
+    summarize
+)
+from main import app
+from utils.hashing import hashing_service
+from utils.rate_limit import login_guard
+
+
+BENCH_USERNAME = "benchflood"
+BENCH_ADMIN = "benchfloodadmin"
+BENCH_PASSWORD = "benchflood"
+
+
+async def flood(
+        client: AsyncClient,
+        victims: list[str],
+        stop: asyncio.Event,
+        statuses: Counter
+) -> None:
+    while not stop.is_set():
+        response = await client.post(
+            url="/users/token/",
+            data={
+                "username": random.choice(victims),
+                "password": "wrongpassword",
+            },
+        )
+        statuses[response.status_code] += 1
+
+
+async def measure(client: AsyncClient, args, user_headers, admin_headers):
+    def poll_salary():
+        return client.get("/salary/me/", headers=user_headers)
+
+    def poll_users():
+        return client.get(
+            "/users/", params={"limit": 100}, headers=admin_headers
+        )
+
+    return {
+        "salary_me": summarize(*await run_concurrently(
+            args.polls, args.poll_concurrency, poll_salary
+        )),
+        "users_list": summarize(*await run_concurrently(
+            args.polls, args.poll_concurrency, poll_users
+        )),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    user_headers = await auth_headers(
+        await seed_user(BENCH_USERNAME, BENCH_PASSWORD)
+    )
+    admin_headers = await auth_headers(
+        await seed_user(BENCH_ADMIN, BENCH_PASSWORD, role="admin")
+    )
+    victims = [
+        username for _, username in await seed_users(
+            "benchvictim", args.victims, BENCH_PASSWORD
+        )
+    ]
+
+    # у каждого атакующего адреса свой клиент
+    attackers = [
+        AsyncClient(
+            transport=ASGITransport(
+                app=app, client=(f"10.0.{number // 256}.{number % 256}", 1)
+            ),
+            base_url="http://bench"
+        )
+        for number in range(args.attacker_ips)
+    ]
+    async with AsyncClient(app=app, base_url="http://bench") as client:
+        # прогрев
+        await measure(client, args, user_headers, admin_headers)
+        idle = await measure(client, args, user_headers, admin_headers)
+
+        stop = asyncio.Event()
+        statuses = Counter()
+        storm = [
+            asyncio.create_task(
+                flood(
+                    attackers[number % len(attackers)], victims, stop,
+                    statuses
+                )
+            )
+            for number in range(args.attackers)
+        ]
+        await asyncio.sleep(0.5)
+        flooded = await measure(client, args, user_headers, admin_headers)
+        stop.set()
+        await asyncio.gather(*storm)
+
+    for attacker in attackers:
+        await attacker.aclose()
+    hashing_service.shutdown()
+    print(json.dumps({
+        "idle": idle,
+        "during_login_flood": flooded,
+        "login_statuses": {
+            str(status): count for status, count in statuses.items()
+        },
+        "hashing": hashing_service.stats(),
+        "login_guard": login_guard.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--polls", type=int, default=300)
+    parser.add_argument("--poll-concurrency", type=int, default=8)
+    parser.add_argument("--attackers", type=int, default=64)
+    parser.add_argument("--attacker-ips", type=int, default=16)
+    parser.add_argument("--victims", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
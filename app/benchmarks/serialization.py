@@ -0,0 +1,100 @@
+"""
+Бенчмарк сериализации ответа GET /users/.
+
+Сравнивает прежний путь (GetUser.from_orm, повторная валидация через
+response_model и JSONResponse) с однократной сериализацией словарей в
+orjson и msgpack для 1, 100 и 10000 пользователей. БД не нужна.
+
+Запуск (из директории app/):
+    python -m benchmarks.serialization --repeat 20
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import time
+import uuid
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from api.schemas import GetUser
+from db.models import Salary, User
+from utils.serialization import JSON, MSGPACK, dumps, user_to_dict
+
+
+SIZES = (1, 100, 10000)
+
+
+def make_users(count: int) -> list[User]:
+    now = datetime.datetime.utcnow()
+    users = []
+    for number in range(count):
+        user = User(
+            id=uuid.uuid4(),
+            username=f"benchuser{number}",
+            email=f"benchuser{number}@bench.ru",
+            first_name="Бенч",
+            last_name="Бенчев",
+            created_date=now
+        )
+        user.salary = Salary(
+            id=uuid.uuid4(),
+            user_id=user.id,
+            current_salary=1000.0 + number,
+            increase_date=now,
+            created_date=now
+        )
+        users.append(user)
+    return users
+
+
+async def pydantic_path(users: list[User], field) -> bytes:
+    # то же, что делал обработчик и FastAPI до перехода на utils.serialization
+    content = [GetUser.from_orm(user) for user in users]
+    content = await serialize_response(field=field, response_content=content)
+    return JSONResponse(content).body
+
+
+async def orjson_path(users: list[User], field) -> bytes:
+    return dumps([user_to_dict(user) for user in users], media_type=JSON)
+
+
+async def msgpack_path(users: list[User], field) -> bytes:
+    return dumps([user_to_dict(user) for user in users], media_type=MSGPACK)
+
+
+async def measure(path, users: list[User], field, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await path(users, field)
+        timings.append(time.perf_counter() - started)
+    return {
+        "best_ms": min(timings) * 1000,
+        "avg_ms": sum(timings) / len(timings) * 1000,
+        "bytes": len(body),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    field = create_response_field(name="response", type_=list[GetUser])
+    report = {}
+    for size in SIZES:
+        users = make_users(size)
+        report[size] = {
+            name: await measure(path, users, field, args.repeat)
+            for name, path in (
+                ("pydantic", pydantic_path),
+                ("orjson", orjson_path),
+                ("msgpack", msgpack_path),
+            )
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""
+Бенчмарк создания и проверки токенов.
+
+Для HS256, ES256 и EdDSA замеряется количество операций encode и decode
+в секунду через utils.tokens.TokenCodec с подготовленными ключами.
+Если установлен python-jose, для сравнения замеряется прежний путь
+jwt.encode / jwt.decode с сырым SECRET_KEY. БД не нужна.
+
+Запуск (из директории app/):
+    python -m benchmarks.tokens --operations 20000
+"""
+import argparse
+import json
+import time
+import uuid
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from utils.tokens import EDDSA, ES256, HS256, TokenCodec, load_key
+
+
+def private_pem(private_key) -> bytes:
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+
+
+def make_codecs() -> dict[str, TokenCodec]:
+    materials = {
+        HS256: b"benchmark-secret-key",
+        ES256: private_pem(ec.generate_private_key(ec.SECP256R1())),
+        EDDSA: private_pem(ed25519.Ed25519PrivateKey.generate()),
+    }
+    return {
+        alg: TokenCodec(keys=[load_key("bench", alg, material)],
+                        active_kid="bench")
+        for alg, material in materials.items()
+    }
+
+
+def throughput(operation, operations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(operations):
+        operation()
+    return operations / (time.perf_counter() - started)
+
+
+def measure(encode, decode, claims: dict, operations: int) -> dict:
+    token = encode(claims)
+    return {
+        "encode_per_second": throughput(lambda: encode(claims), operations),
+        "decode_per_second": throughput(lambda: decode(token), operations),
+        "token_bytes": len(token),
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    claims = {
+        "sub": str(uuid.uuid4()), "exp": int(time.time()) + 3600,
+        "role": "user", "ver": 1,
+    }
+    results = {
+        alg: measure(codec.encode, codec.decode, claims, args.operations)
+        for alg, codec in make_codecs().items()
+    }
+
+    try:
+        from jose import jwt
+    except ImportError:
+        jwt = None
+    if jwt is not None:
+        # то, что делал utils.security до перехода на TokenCodec
+        key = "benchmark-secret-key"
+        results["HS256 (python-jose)"] = measure(
+            lambda data: jwt.encode(claims=data, key=key, algorithm=HS256),
+            lambda token: jwt.decode(token=token, key=key, algorithms=HS256),
+            claims, args.operations
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--operations", type=int, default=10000)
+    main(parser.parse_args())
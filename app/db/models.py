@@ -1,15 +1,22 @@
 import datetime
 import uuid
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import DDL, BigInteger, ForeignKey, Index, Sequence, event
 from sqlalchemy.orm import (DeclarativeBase, Mapped, backref, mapped_column,
                             relationship)
 
+from db.salary_stats import SALARY_STATS_DDL
+
 
 class Base(DeclarativeBase):
     pass
 
 
+# общая для всех пользователей возрастающая последовательность версий
+# токенов: по ней в памяти догружаются только изменившиеся записи
+token_version_seq = Sequence("users_token_version_seq", metadata=Base.metadata)
+
+
 class User(Base):
     """
     Модель пользователя
@@ -18,6 +25,11 @@ class User(Base):
     ROLES = ("admin", "user")
 
     __tablename__ = "users"
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        # keyset-пагинация по (created_date, id)
+        Index("ix_users_created_date_id", "created_date", "id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     username: Mapped[str] = mapped_column(unique=True)
@@ -26,6 +38,9 @@ class User(Base):
     first_name: Mapped[str]
     last_name: Mapped[str]
     role: Mapped[str] = mapped_column(default="user")
+    token_version: Mapped[int] = mapped_column(
+        BigInteger, server_default=token_version_seq.next_value()
+    )
     created_date: Mapped[datetime.datetime] = mapped_column(
         default=datetime.datetime.utcnow
     )
@@ -41,12 +56,23 @@ class Salary(Base):
     """
 
     __tablename__ = "salaries"
+    __table_args__ = (
+        # версия зарплаты по user_id читается только из индекса
+        Index(
+            "ix_salaries_user_id_version", "user_id",
+            postgresql_include=["id", "version"]
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id",
                                                           ondelete="CASCADE"))
     current_salary: Mapped[float] = mapped_column(nullable=True)
     increase_date: Mapped[datetime.datetime] = mapped_column(nullable=True)
+    # увеличивается при каждом изменении, из нее строится ETag; только
+    # значение по умолчанию в БД: с default на стороне Python
+    # INSERT ... FROM SELECT при регистрации передает NULL
+    version: Mapped[int] = mapped_column(BigInteger, server_default="1")
     created_date: Mapped[datetime.datetime] = mapped_column(
         default=datetime.datetime.utcnow
     )
@@ -54,3 +80,104 @@ class Salary(Base):
     user = relationship("User", backref=backref(
         "salary", uselist=False, lazy="joined"
     ))
+
+
+class SalaryHistory(Base):
+    """
+    Модель истории изменений зарплаты.
+
+    Таблица только пополняется и секционирована по месяцам effective_date,
+    секции создаются по мере необходимости (см. db/partitions.py).
+    """
+
+    __tablename__ = "salary_history"
+    __table_args__ = (
+        Index(
+            "ix_salary_history_user_id_effective_date",
+            "user_id", "effective_date"
+        ),
+        {"postgresql_partition_by": "RANGE (effective_date)"},
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    effective_date: Mapped[datetime.datetime] = mapped_column(
+        primary_key=True, default=datetime.datetime.utcnow
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id",
+                                                          ondelete="CASCADE"))
+    current_salary: Mapped[float] = mapped_column(nullable=True)
+    increase_date: Mapped[datetime.datetime] = mapped_column(nullable=True)
+
+
+class RefreshToken(Base):
+    """
+    Выданный refresh токен. Хранится только его хеш
+    """
+
+    __tablename__ = "refresh_tokens"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), index=True
+    )
+    token_hash: Mapped[str] = mapped_column(unique=True)
+    expires_at: Mapped[datetime.datetime]
+    created_date: Mapped[datetime.datetime] = mapped_column(
+        default=datetime.datetime.utcnow
+    )
+
+
+class RefreshTokenRevocation(Base):
+    """
+    Отозванный refresh токен. Записи только добавляются: по возрастающему
+    id фильтр отзывов в памяти догружает новые
+    """
+
+    __tablename__ = "refresh_token_revocations"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    token_id: Mapped[uuid.UUID] = mapped_column(index=True)
+    # после истечения срока токена запись больше не нужна фильтру
+    expires_at: Mapped[datetime.datetime]
+    revoked_at: Mapped[datetime.datetime] = mapped_column(
+        default=datetime.datetime.utcnow
+    )
+
+
+class SalarySketchBucket(Base):
+    """
+    Бакет логарифмического скетча зарплат (см. db/salary_stats.py):
+    количество и сумма зарплат бакета. Поддерживается триггерами salaries
+    """
+
+    __tablename__ = "salary_sketch"
+
+    bucket: Mapped[int] = mapped_column(primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, default=0)
+    total: Mapped[float] = mapped_column(default=0)
+
+
+class SalaryRaisesMonth(Base):
+    """
+    Количество повышений зарплаты, запланированных на месяц.
+    Поддерживается триггерами salaries
+    """
+
+    __tablename__ = "salary_raises_by_month"
+
+    month: Mapped[datetime.datetime] = mapped_column(primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+# секция по умолчанию, чтобы вставка не падала, если секция месяца
+# еще не создана
+event.listen(
+    SalaryHistory.__table__,
+    "after_create",
+    DDL("CREATE TABLE salary_history_default "
+        "PARTITION OF salary_history DEFAULT")
+)
+
+# триггеры сводки по зарплатам создаются после всех таблиц
+for statement in SALARY_STATS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement))
@@ -0,0 +1,80 @@
+import datetime
+import logging
+from functools import partial
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.session import after_commit
+
+
+logger = logging.getLogger("uvicorn.error")
+
+# месяцы, для которых секцию больше не нужно создавать: созданные -
+# после фиксации транзакции, несозданные из-за ошибки - сразу
+_known_salary_history_months: set[tuple[int, int]] = set()
+
+
+def month_bounds(
+        moment: datetime.datetime
+) -> tuple[datetime.datetime, datetime.datetime]:
+    """
+    Начало месяца и начало следующего месяца
+    """
+
+    start = moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+async def ensure_salary_history_partition(
+        session: AsyncSession,
+        moment: datetime.datetime
+) -> None:
+    """
+    Создание секции salary_history для месяца moment, если ее еще нет.
+    Вызывается внутри транзакции, пишущей историю
+    """
+
+    key = (moment.year, moment.month)
+    if key in _known_salary_history_months:
+        return
+
+    start, end = month_bounds(moment)
+    ddl = text(
+        f"CREATE TABLE IF NOT EXISTS "
+        f"salary_history_y{start:%Y}m{start:%m} "
+        f"PARTITION OF salary_history "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+    try:
+        # секцию параллельно может создавать другой процесс
+        async with session.begin_nested():
+            await session.execute(ddl)
+    except DBAPIError as error:
+        # обычно в секции по умолчанию уже есть строки этого месяца, и
+        # повтор будет падать так же на каждой записи; строки месяца
+        # продолжат писаться в секцию по умолчанию
+        logger.warning(
+            "Секция salary_history за %04d-%02d не создана, записи месяца "
+            "попадут в секцию по умолчанию: %s", *key, error.orig
+        )
+        _known_salary_history_months.add(key)
+        return
+    after_commit(session, partial(_known_salary_history_months.add, key))
+
+
+async def create_upcoming_salary_history_partitions(
+        session: AsyncSession,
+        months: int = 2
+) -> None:
+    """
+    Заблаговременное создание секций текущего и следующих месяцев, чтобы
+    запись истории не выполняла DDL. Транзакцию фиксирует вызывающий
+    """
+
+    moment = datetime.datetime.utcnow()
+    for _ in range(months):
+        await ensure_salary_history_partition(session=session, moment=moment)
+        _, moment = month_bounds(moment)
@@ -0,0 +1,173 @@
+import asyncio
+import itertools
+import time
+import uuid
+from typing import AsyncGenerator
+
+from fastapi import Depends, Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine
+)
+
+from db.session import (
+    async_session,
+    engine,
+    engine_options,
+    get_session,
+    instrument_engine
+)
+from settings import (
+    READ_YOUR_WRITES_SECONDS,
+    REPLICA_DATABASE_URLS,
+    REPLICA_LAG_CHECK_SECONDS,
+    REPLICA_MAX_LAG_SECONDS
+)
+from utils.cache import TTLCache
+from utils.tokens import InvalidToken, get_unverified_claims
+
+
+# отставание реплики в секундах; если все полученные изменения уже
+# применены, реплика считается актуальной
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM "
+    "now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReplicaRouter:
+    """
+    Выбор движка для читающих запросов.
+
+    Запросы распределяются по репликам по кругу. Запрос идет в основную БД,
+    если реплик нет, все они отстают больше max_lag секунд или пользователь
+    недавно менял данные (read-your-writes).
+    """
+
+    def __init__(
+            self,
+            primary: AsyncEngine,
+            replicas: list[AsyncEngine],
+            max_lag: float,
+            lag_check_interval: float,
+            sticky_seconds: float,
+            sticky_max_size: int = 10000
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self._sticky = TTLCache(max_size=sticky_max_size, ttl=sticky_seconds)
+        self._lag = {id(replica): (float("-inf"), 0.0) for replica in replicas}
+        self._locks = {id(replica): asyncio.Lock() for replica in replicas}
+        self._next = itertools.count()
+
+    def mark_write(self, *user_ids: uuid.UUID | str) -> None:
+        """
+        Пользователи, чьи чтения какое-то время нужно вести из основной БД
+        """
+
+        for user_id in user_ids:
+            self._sticky.set(str(user_id), True)
+
+    async def choose(self, user_id: str | None = None) -> AsyncEngine:
+        if not self.replicas:
+            return self.primary
+        if user_id is not None and self._sticky.get(user_id):
+            return self.primary
+
+        start = next(self._next)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if await self.lag(replica) <= self.max_lag:
+                return replica
+        return self.primary
+
+    async def lag(self, replica: AsyncEngine) -> float:
+        checked_at, lag = self._lag[id(replica)]
+        lock = self._locks[id(replica)]
+        if (time.monotonic() - checked_at < self.lag_check_interval or
+                lock.locked()):
+            return lag
+
+        async with lock:
+            try:
+                async with replica.connect() as connection:
+                    lag = float(await connection.scalar(REPLICA_LAG_QUERY))
+            except Exception:
+                # недоступная реплика не используется до следующей проверки
+                lag = float("inf")
+            self._lag[id(replica)] = (time.monotonic(), lag)
+        return lag
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "lag_seconds": [lag for _, lag in self._lag.values()],
+            "sticky_users": len(self._sticky),
+        }
+
+
+def token_subject(request: Request) -> str | None:
+    """
+    Пользователь из токена без проверки подписи: используется только
+    для выбора реплики, а не для авторизации
+    """
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return get_unverified_claims(token).get("sub")
+    except InvalidToken:
+        return None
+
+
+replica_engines = [
+    create_async_engine(url, **engine_options())
+    for url in REPLICA_DATABASE_URLS
+]
+replica_pool_stats = [
+    instrument_engine(replica) for replica in replica_engines
+]
+
+replica_router = ReplicaRouter(
+    primary=engine,
+    replicas=replica_engines,
+    max_lag=REPLICA_MAX_LAG_SECONDS,
+    lag_check_interval=REPLICA_LAG_CHECK_SECONDS,
+    sticky_seconds=READ_YOUR_WRITES_SECONDS
+)
+
+
+# методы, запросы которых можно отправлять на реплики
+READ_ONLY_METHODS = ("GET", "HEAD")
+
+
+async def get_read_session(
+        request: Request,
+        session: AsyncSession = Depends(get_session)
+) -> AsyncGenerator:
+    """
+    Сессия для читающих запросов: реплика или основная БД.
+
+    Если запрос изменяющий или выбрана основная БД, отдается сессия
+    запроса, чтобы аутентификация и action работали в одной транзакции
+    """
+
+    if request.method not in READ_ONLY_METHODS:
+        yield session
+        return
+    bind = await replica_router.choose(user_id=token_subject(request))
+    if bind is replica_router.primary:
+        yield session
+        return
+    try:
+        read_session: AsyncSession = async_session(bind=bind)
+        yield read_session
+    finally:
+        await read_session.close()
@@ -0,0 +1,156 @@
+import math
+
+
+# относительная погрешность перцентилей: значение бакета отличается
+# от любой попавшей в него зарплаты не больше чем на 1%
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+# бакет для нулевых и отрицательных зарплат
+ZERO_BUCKET = -2147483648
+
+
+# номер бакета логарифмического скетча (как в DDSketch): зарплата x
+# попадает в бакет ceil(log_gamma(x)), бакетов на диапазон от 1 до 10^9
+# около тысячи при любом количестве сотрудников
+BUCKET_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION salary_sketch_bucket(value double precision)
+RETURNS integer LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE WHEN value > 0
+        THEN ceil(ln(value) / ln({GAMMA!r}))::integer
+        ELSE {ZERO_BUCKET} END
+$$
+"""
+
+# изменение сводки по строкам changes(current_salary, increase_date, sign);
+# строки группируются и блокируются в порядке ключей, чтобы параллельные
+# транзакции не ждали друг друга по кругу
+_APPLY_CHANGES = ("""
+    INSERT INTO salary_sketch (bucket, count, total)
+    SELECT salary_sketch_bucket(current_salary), sum(sign),
+           sum(sign * current_salary)
+    FROM ({changes}) AS changes
+    WHERE current_salary IS NOT NULL
+    GROUP BY 1 ORDER BY 1
+    ON CONFLICT (bucket) DO UPDATE SET
+        count = salary_sketch.count + excluded.count,
+        total = salary_sketch.total + excluded.total
+""", """
+    INSERT INTO salary_raises_by_month (month, count)
+    SELECT date_trunc('month', increase_date), sum(sign)
+    FROM ({changes}) AS changes
+    WHERE increase_date IS NOT NULL
+    GROUP BY 1 ORDER BY 1
+    ON CONFLICT (month) DO UPDATE SET
+        count = salary_raises_by_month.count + excluded.count
+""")
+
+
+def _apply_changes(changes: str) -> list[str]:
+    return [statement.format(changes=changes) for statement in _APPLY_CHANGES]
+
+
+_CHANGES = {
+    "INSERT": "SELECT current_salary, increase_date, 1 AS sign FROM new_rows",
+    "UPDATE": (
+        "SELECT current_salary, increase_date, -1 AS sign FROM old_rows "
+        "UNION ALL "
+        "SELECT current_salary, increase_date, 1 AS sign FROM new_rows"
+    ),
+    "DELETE": "SELECT current_salary, increase_date, -1 AS sign FROM old_rows",
+}
+
+_REFERENCING = {
+    "INSERT": "NEW TABLE AS new_rows",
+    "UPDATE": "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "DELETE": "OLD TABLE AS old_rows",
+}
+
+
+def _trigger_ddl(operation: str) -> list[str]:
+    name = f"salary_stats_{operation.lower()}"
+    return [
+        f"""
+CREATE OR REPLACE FUNCTION {name}() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    {";".join(_apply_changes(_CHANGES[operation]))};
+    RETURN NULL;
+END
+$$
+""",
+        f"DROP TRIGGER IF EXISTS {name} ON salaries",
+        # один вызов на запрос, а не на строку: массовое обновление
+        # меняет сводку одним INSERT ... ON CONFLICT на таблицу
+        f"CREATE TRIGGER {name} AFTER {operation} ON salaries "
+        f"REFERENCING {_REFERENCING[operation]} "
+        f"FOR EACH STATEMENT EXECUTE FUNCTION {name}()",
+    ]
+
+
+# функции и триггеры, поддерживающие salary_sketch и
+# salary_raises_by_month при любом изменении salaries, включая
+# каскадное удаление вместе с пользователем
+SALARY_STATS_DDL = [
+    BUCKET_FUNCTION,
+    *_trigger_ddl("INSERT"),
+    *_trigger_ddl("UPDATE"),
+    *_trigger_ddl("DELETE"),
+]
+
+SALARY_STATS_DROP_DDL = [
+    *(
+        statement
+        for operation in ("INSERT", "UPDATE", "DELETE")
+        for statement in (
+            f"DROP TRIGGER IF EXISTS salary_stats_{operation.lower()} "
+            f"ON salaries",
+            f"DROP FUNCTION IF EXISTS salary_stats_{operation.lower()}()",
+        )
+    ),
+    "DROP FUNCTION IF EXISTS salary_sketch_bucket(double precision)",
+]
+
+# полный пересчет сводки, например после изменения GAMMA
+SALARY_STATS_REBUILD = [
+    "DELETE FROM salary_sketch",
+    "DELETE FROM salary_raises_by_month",
+    *_apply_changes(
+        "SELECT current_salary, increase_date, 1 AS sign FROM salaries"
+    ),
+]
+
+
+def bucket_value(bucket: int) -> float:
+    """
+    Значение, представляющее бакет: середина его границ по относительной
+    погрешности
+    """
+
+    if bucket == ZERO_BUCKET:
+        return 0.0
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+
+def quantiles(
+        buckets: list[tuple[int, int]],
+        ranks: tuple[float, ...]
+) -> list[float | None]:
+    """
+    Приближенные квантили по бакетам (номер, количество), отсортированным
+    по номеру
+    """
+
+    count = sum(bucket_count for _, bucket_count in buckets)
+    if count <= 0:
+        return [None] * len(ranks)
+    result = []
+    for rank in ranks:
+        # номер элемента в отсортированном списке, как у percentile_disc
+        target = max(1, math.ceil(rank * count))
+        seen = 0
+        for bucket, bucket_count in buckets:
+            seen += bucket_count
+            if seen >= target:
+                result.append(bucket_value(bucket))
+                break
+    return result
@@ -1,12 +1,173 @@
-from typing import AsyncGenerator
+import time
+import uuid
+from typing import AsyncGenerator, Callable
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine
+)
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from settings import (
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_PGBOUNCER,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE
+)
+
+
+class PoolStats:
+    """
+    Счетчики работы пула соединений
+    """
+
+    def __init__(self):
+        self.connects = 0
+        self.disconnects = 0
+        self.invalidations = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.checkout_wait_seconds = 0.0
+        self.checkout_wait_max_seconds = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        self.checkout_wait_seconds += seconds
+        self.checkout_wait_max_seconds = max(
+            self.checkout_wait_max_seconds, seconds
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+            "invalidations": self.invalidations,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "timeouts": self.timeouts,
+            "checkout_wait_seconds": self.checkout_wait_seconds,
+            "checkout_wait_avg_seconds": (
+                self.checkout_wait_seconds / self.checkouts
+                if self.checkouts else 0.0
+            ),
+            "checkout_wait_max_seconds": self.checkout_wait_max_seconds,
+        }
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, замеряющий время ожидания свободного соединения
+    """
+
+    stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.record_wait(time.perf_counter() - started)
+
+
+def engine_options() -> dict:
+    """
+    Параметры пула соединений из настроек
+    """
+
+    if DB_PGBOUNCER:
+        # PgBouncer в режиме транзакций не сохраняет подготовленные
+        # выражения между запросами, а пулом занимается он сам
+        return {
+            "poolclass": NullPool,
+            "connect_args": {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func":
+                    lambda: f"__asyncpg_{uuid.uuid4()}__",
+            },
+        }
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "connect_args": {
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        },
+    }
+
+
+def instrument_engine(engine: AsyncEngine) -> PoolStats:
+    """
+    Подписка счетчиков на события пула соединений движка
+    """
 
-from settings import DATABASE_URL
+    stats = PoolStats()
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.stats = stats
 
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        stats.connects += 1
 
-engine = create_async_engine(DATABASE_URL)
+    @event.listens_for(engine.sync_engine, "close")
+    def on_close(dbapi_connection, connection_record):
+        stats.disconnects += 1
+
+    @event.listens_for(engine.sync_engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        stats.invalidations += 1
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.checkouts += 1
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        stats.checkins += 1
+
+    return stats
+
+
+def get_pool_stats(engine: AsyncEngine, stats: PoolStats) -> dict:
+    """
+    Текущее состояние пула соединений движка
+    """
+
+    pool = engine.pool
+    current = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        current.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": pool._max_overflow,
+        })
+    current.update(stats.as_dict())
+    return current
+
+
+engine = create_async_engine(DATABASE_URL, **engine_options())
+pool_stats = instrument_engine(engine)
 
 async_session = sessionmaker(
     engine,
@@ -15,7 +176,36 @@ async_session = sessionmaker(
 )
 
 
+def after_commit(session: AsyncSession, callback: Callable[[], None]) -> None:
+    """
+    Вызов callback после фиксации текущей транзакции сессии.
+    При откате транзакции callback отбрасывается
+    """
+
+    session.info.setdefault("after_commit", []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def run_after_commit(session: Session) -> None:
+    for callback in session.info.pop("after_commit", []):
+        callback()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def drop_after_commit(session: Session, previous_transaction) -> None:
+    session.info.pop("after_commit", None)
+
+
 async def get_session() -> AsyncGenerator:
+    """
+    Сессия запроса: одна на запрос и общая для аутентификации и actions.
+
+    Транзакция начинается при первом запросе к БД, actions свои транзакции
+    не открывают. Изменяющие обработчики фиксируют ее один раз через
+    session.commit(), незафиксированная транзакция откатывается при
+    закрытии сессии
+    """
+
     try:
         session: AsyncSession = async_session()
         yield session
@@ -1,18 +1,59 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import APIRouter, FastAPI
 
+from api.handlers.internal_handlers import (
+    health_router,
+    internal_router,
+    jwks_router,
+    metrics_router
+)
 from api.handlers.salary_handlers import salary_router
 from api.handlers.user_handlers import user_router
+from db.replicas import replica_engines
+from db.session import engine
+from settings import SERVER_FORWARDED_ALLOW_IPS
+from utils.hashing import hashing_service
+from utils.metrics import MetricsMiddleware, instrument_queries
+from utils.warmup import warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # прогрев идет в фоне: /live отвечает сразу, /ready - после прогрева
+    warm_up_task = asyncio.create_task(
+        warm_up(engines=[engine, *replica_engines])
+    )
+    yield
+    warm_up_task.cancel()
+    hashing_service.shutdown()
 
 
-app = FastAPI(title="Workers salaries")
+app = FastAPI(title="Workers salaries", lifespan=lifespan)
 
 main_router = APIRouter()
 
 main_router.include_router(user_router, prefix="/users", tags=["users"])
 main_router.include_router(salary_router, prefix="/salary", tags=["salaries"])
+main_router.include_router(
+    internal_router, prefix="/internal", tags=["internal"],
+    include_in_schema=False
+)
 
 app.include_router(main_router)
+app.include_router(metrics_router, include_in_schema=False)
+app.include_router(health_router, include_in_schema=False)
+app.include_router(jwks_router, include_in_schema=False)
+app.add_middleware(MetricsMiddleware)
+
+for db_engine in (engine, *replica_engines):
+    instrument_queries(db_engine)
+
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=80)
+    uvicorn.run(
+        app, host="0.0.0.0", port=80, proxy_headers=True,
+        forwarded_allow_ips=SERVER_FORWARDED_ALLOW_IPS
+    )
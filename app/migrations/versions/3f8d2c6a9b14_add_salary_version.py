@@ -0,0 +1,25 @@
+"""add version in Salary
+
+Revision ID: 3f8d2c6a9b14
+Revises: e7b5a3c91d20
+Create Date: 2026-10-17 18:24:09.537120
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3f8d2c6a9b14'
+down_revision = 'e7b5a3c91d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('salaries', sa.Column('version', sa.BigInteger(), server_default='1', nullable=False))
+    op.create_index('ix_salaries_user_id_version', 'salaries', ['user_id'], unique=False, postgresql_include=['id', 'version'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_salaries_user_id_version', table_name='salaries')
+    op.drop_column('salaries', 'version')
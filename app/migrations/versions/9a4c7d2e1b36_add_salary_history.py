@@ -0,0 +1,35 @@
+"""add salary_history
+
+Revision ID: 9a4c7d2e1b36
+Revises: 5d2b8e61c4f0
+Create Date: 2026-10-17 12:21:08.331907
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '9a4c7d2e1b36'
+down_revision = '5d2b8e61c4f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('salary_history',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('effective_date', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Uuid(), nullable=False),
+    sa.Column('current_salary', sa.Float(), nullable=True),
+    sa.Column('increase_date', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'effective_date'),
+    postgresql_partition_by='RANGE (effective_date)'
+    )
+    op.create_index('ix_salary_history_user_id_effective_date', 'salary_history', ['user_id', 'effective_date'], unique=False)
+    op.execute('CREATE TABLE salary_history_default PARTITION OF salary_history DEFAULT')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_salary_history_user_id_effective_date', table_name='salary_history')
+    op.drop_table('salary_history')
@@ -0,0 +1,49 @@
+"""add salary_sketch and salary_raises_by_month
+
+Revision ID: b5c1e8d4f2a7
+Revises: 3f8d2c6a9b14
+Create Date: 2026-10-17 19:41:52.208413
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from db.salary_stats import (
+    SALARY_STATS_DDL,
+    SALARY_STATS_DROP_DDL,
+    SALARY_STATS_REBUILD
+)
+
+# revision identifiers, used by Alembic.
+revision = 'b5c1e8d4f2a7'
+down_revision = '3f8d2c6a9b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('salary_sketch',
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('bucket')
+    )
+    op.create_table('salary_raises_by_month',
+    sa.Column('month', sa.DateTime(), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('month')
+    )
+    # сводка заполняется по текущим зарплатам под блокировкой, чтобы
+    # изменения между пересчетом и созданием триггеров не потерялись
+    op.execute('LOCK TABLE salaries IN SHARE MODE')
+    for statement in SALARY_STATS_DDL:
+        op.execute(statement)
+    for statement in SALARY_STATS_REBUILD:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    for statement in SALARY_STATS_DROP_DDL:
+        op.execute(statement)
+    op.drop_table('salary_raises_by_month')
+    op.drop_table('salary_sketch')
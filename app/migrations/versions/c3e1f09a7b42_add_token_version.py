@@ -0,0 +1,25 @@
+"""add token_version in User
+
+Revision ID: c3e1f09a7b42
+Revises: f02e74700280
+Create Date: 2026-10-17 10:12:41.518224
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c3e1f09a7b42'
+down_revision = 'f02e74700280'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence('users_token_version_seq')))
+    op.add_column('users', sa.Column('token_version', sa.BigInteger(), server_default=sa.text("nextval('users_token_version_seq'::regclass)"), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
+    op.execute(sa.schema.DropSequence(sa.Sequence('users_token_version_seq')))
@@ -0,0 +1,87 @@
+"""
+Запуск сервера в production: gunicorn с воркерами uvicorn.
+
+Количество процессов берется из WEB_CONCURRENCY, по умолчанию - по
+процессу на ядро. Приложение импортируется в главном процессе до fork,
+после чего его объекты замораживаются gc.freeze(), чтобы сборщик мусора
+воркеров не трогал общие страницы памяти и они оставались copy-on-write.
+uvloop и httptools используются, если установлены.
+
+Сигналы главному процессу:
+    HUP  - плавный перезапуск воркеров (текущие запросы дорабатываются)
+    USR2 - запуск нового главного процесса с новым кодом, после чего
+           старый останавливается сигналом QUIT
+    TTIN / TTOU - добавить / убрать воркер
+
+Запуск (из директории app/):
+    python server.py
+"""
+import gc
+import os
+
+
+# до импорта settings: от количества процессов зависят размеры пулов
+os.environ.setdefault("WEB_CONCURRENCY", str(os.cpu_count() or 1))
+
+from gunicorn.app.base import BaseApplication  # noqa: E402
+
+from settings import (  # noqa: E402
+    SERVER_BACKLOG,
+    SERVER_BIND,
+    SERVER_FORWARDED_ALLOW_IPS,
+    SERVER_GRACEFUL_TIMEOUT,
+    SERVER_KEEPALIVE,
+    WEB_CONCURRENCY
+)
+
+
+def when_ready(server) -> None:
+    # все, что создано при импорте приложения, переживет fork без
+    # копирования страниц сборщиком мусора
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker) -> None:
+    # соединения, открытые главным процессом, воркерам не принадлежат
+    from db.replicas import replica_engines
+    from db.session import engine
+
+    for db_engine in (engine, *replica_engines):
+        db_engine.sync_engine.dispose(close=False)
+
+
+class Server(BaseApplication):
+    """
+    gunicorn с заранее загруженным приложением из main.py
+    """
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from main import app
+
+        return app
+
+
+if __name__ == "__main__":
+    Server({
+        "bind": SERVER_BIND,
+        "workers": WEB_CONCURRENCY,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "backlog": SERVER_BACKLOG,
+        "keepalive": SERVER_KEEPALIVE,
+        "graceful_timeout": SERVER_GRACEFUL_TIMEOUT,
+        # UvicornWorker передает его uvicorn, заголовки прокси
+        # (proxy_headers) у воркера включены
+        "forwarded_allow_ips": SERVER_FORWARDED_ALLOW_IPS,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+    }).run()
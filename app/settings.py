@@ -14,9 +14,162 @@ DB_PASS = os.getenv("POSTGRES_PASSWORD")
 DATABASE_URL = (f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}"
                 f"/{DB_NAME}")
 
+# количество процессов сервера, server.py по умолчанию запускает
+# по процессу на ядро
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+
+# настройки пула соединений с БД
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+# общее количество соединений с каждой БД на все процессы сервера,
+# 0 - без ограничения. Пул каждого процесса урезается до своей доли
+DB_CONNECTION_BUDGET = int(os.getenv("DB_CONNECTION_BUDGET", 0))
+if DB_CONNECTION_BUDGET:
+    _worker_connections = max(1, DB_CONNECTION_BUDGET // WEB_CONCURRENCY)
+    DB_POOL_SIZE = min(DB_POOL_SIZE, _worker_connections)
+    DB_MAX_OVERFLOW = min(
+        DB_MAX_OVERFLOW, _worker_connections - DB_POOL_SIZE
+    )
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+# через сколько секунд пересоздавать соединение, -1 - никогда
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+# размер кеша подготовленных выражений asyncpg на соединение
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# работа через PgBouncer: без подготовленных выражений и своего пула
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+# реплики для читающих запросов через запятую в формате DATABASE_URL
+REPLICA_DATABASE_URLS = [
+    url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",")
+    if url.strip()
+]
+# при большем отставании чтение идет в основную БД
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", 1))
+# сколько секунд после изменения зарплаты читать данные из основной БД
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 10))
+
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # время жизни токена
-ALGORITHM = os.getenv("ALGORITHM")
+# время жизни refresh токена
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+# алгоритм подписи токенов: HS256 (SECRET_KEY), ES256 или EdDSA
+# (закрытый ключ в PEM из TOKEN_PRIVATE_KEY_FILE)
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
 SECRET_KEY = os.getenv("SECRET_KEY")
+TOKEN_PRIVATE_KEY_FILE = os.getenv("TOKEN_PRIVATE_KEY_FILE")
+# ключ подписи и хеширования refresh токенов, по умолчанию SECRET_KEY;
+# при подписи access токенов ES256 или EdDSA задается отдельно
+REFRESH_TOKEN_SECRET_KEY = os.getenv("REFRESH_TOKEN_SECRET_KEY") or SECRET_KEY
+# kid ключа, которым подписываются новые токены
+TOKEN_ACTIVE_KID = os.getenv("TOKEN_ACTIVE_KID", "main")
+# ключи, которые принимаются только для проверки (ротация), через запятую
+# в формате kid:алгоритм:путь к PEM или файлу с секретом для HS256
+TOKEN_VERIFY_KEYS = [
+    key.strip() for key in os.getenv("TOKEN_VERIFY_KEYS", "").split(",")
+    if key.strip()
+]
+
+# режим аутентификации: stateful - пользователь загружается из БД на каждый
+# запрос, stateless - роль и версия берутся из токена
+AUTH_MODE = os.getenv("AUTH_MODE", "stateful")
+# как часто догружать изменившиеся версии токенов и перечитывать их
+# целиком, сколько последних версий перечитывать при догрузке
+TOKEN_VERSIONS_REFRESH_SECONDS = float(
+    os.getenv("TOKEN_VERSIONS_REFRESH_SECONDS", 5)
+)
+TOKEN_VERSIONS_FULL_REFRESH_SECONDS = float(
+    os.getenv("TOKEN_VERSIONS_FULL_REFRESH_SECONDS", 300)
+)
+TOKEN_VERSIONS_WATERMARK_OVERLAP = int(
+    os.getenv("TOKEN_VERSIONS_WATERMARK_OVERLAP", 1000)
+)
+
+# фильтр отозванных refresh токенов: как часто догружать новые отзывы
+# и перестраивать фильтр целиком, сколько последних id отзывов
+# перечитывать при догрузке, на сколько отзывов он рассчитан и
+# допустимая доля ложных срабатываний
+REVOCATIONS_REFRESH_SECONDS = float(
+    os.getenv("REVOCATIONS_REFRESH_SECONDS", 5)
+)
+REVOCATIONS_FULL_REFRESH_SECONDS = float(
+    os.getenv("REVOCATIONS_FULL_REFRESH_SECONDS", 300)
+)
+REVOCATIONS_WATERMARK_OVERLAP = int(
+    os.getenv("REVOCATIONS_WATERMARK_OVERLAP", 1000)
+)
+REVOCATION_FILTER_CAPACITY = int(
+    os.getenv("REVOCATION_FILTER_CAPACITY", 100000)
+)
+REVOCATION_FILTER_ERROR_RATE = float(
+    os.getenv("REVOCATION_FILTER_ERROR_RATE", 0.001)
+)
+
+# кеш пользователей, полученных по токену
+PRINCIPAL_CACHE_TTL_SECONDS = float(
+    os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 30)
+)
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", 10000))
+
+# кеш готовых ответов GET /users/ и /salary/{user_id}/: объем в байтах
+# и время жизни, которое ограничивает устаревание в других процессах
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+)
+RESPONSE_CACHE_TTL_SECONDS = float(
+    os.getenv("RESPONSE_CACHE_TTL_SECONDS", 5)
+)
+
+# размер страницы списков по умолчанию и максимальный
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", 100))
+PAGE_MAX_SIZE = int(os.getenv("PAGE_MAX_SIZE", 1000))
+# сколько строк за раз забирать из серверного курсора при стриминге
+STREAM_FETCH_SIZE = int(os.getenv("STREAM_FETCH_SIZE", 1000))
+# выгрузка зарплат: строк за одно чтение курсора (они же кодируются
+# одним куском) и уровень gzip - быстрый по умолчанию, выгрузки большие
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", 10000))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", 1))
+
+# максимальное количество записей в одном массовом запросе
+BULK_MAX_SIZE = int(os.getenv("BULK_MAX_SIZE", 5000))
+
+# количество процессов для хеширования паролей, ядра делятся поровну
+# между процессами сервера. Логины и регистрации получают отдельные
+# процессы, поэтому их запускается не меньше двух
+HASHING_POOL_SIZE = int(os.getenv(
+    "HASHING_POOL_SIZE", max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+))
+# сколько задач хеширования может ждать в очереди каждой полосы
+HASHING_QUEUE_LIMIT = int(os.getenv("HASHING_QUEUE_LIMIT", 64))
+
+# ограничение частоты логинов: попыток в минуту и запас на всплеск
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", 60))
+LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", 20))
+LOGIN_USERNAME_PER_MINUTE = float(os.getenv("LOGIN_USERNAME_PER_MINUTE", 10))
+LOGIN_USERNAME_BURST = float(os.getenv("LOGIN_USERNAME_BURST", 5))
+# сколько IP и username отслеживается одновременно
+LOGIN_LIMITER_MAX_KEYS = int(os.getenv("LOGIN_LIMITER_MAX_KEYS", 100000))
+# логины отклоняются, если очередь bcrypt заполнена на эту долю
+LOGIN_SHED_QUEUE_RATIO = float(os.getenv("LOGIN_SHED_QUEUE_RATIO", 0.8))
+# или средняя загрузка системы на ядро выше порога, 0 - не проверять
+LOGIN_SHED_LOAD = float(os.getenv("LOGIN_SHED_LOAD", 0))
+
+# настройки server.py
+SERVER_BIND = os.getenv("SERVER_BIND", "0.0.0.0:80")
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", 2048))
+SERVER_KEEPALIVE = int(os.getenv("SERVER_KEEPALIVE", 5))
+# сколько секунд процесс дорабатывает запросы при перезапуске
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30))
+# адреса прокси через запятую (или *), которым доверяются заголовки
+# X-Forwarded-For и X-Forwarded-Proto: по ним определяется IP клиента,
+# в том числе для ограничения частоты логинов
+SERVER_FORWARDED_ALLOW_IPS = os.getenv(
+    "SERVER_FORWARDED_ALLOW_IPS", "127.0.0.1"
+)
+# пауза между попытками открыть соединения с БД при прогреве: растет
+# вдвое от минимальной до максимальной
+WARM_UP_RETRY_MIN_SECONDS = float(os.getenv("WARM_UP_RETRY_MIN_SECONDS", 0.5))
+WARM_UP_RETRY_MAX_SECONDS = float(os.getenv("WARM_UP_RETRY_MAX_SECONDS", 30))
 
 
 TEST_DB_PORT = os.getenv("TEST_DB_PORT")
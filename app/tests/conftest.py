@@ -1,5 +1,7 @@
 import asyncio
 import uuid
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 import pytest
@@ -8,15 +10,18 @@ from httpx import AsyncClient
 from main import app
 from pydantic import BaseModel
 from settings import ACCESS_TOKEN_EXPIRE_MINUTES, TEST_DATABASE_URL
-from sqlalchemy import func, select
+from sqlalchemy import event, func, select
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from db.models import Base, Salary, User
 from utils.hashing import Hasher
+from utils.metrics import instrument_queries
+from utils.response_cache import response_cache
 from utils.security import create_access_token
 
 engine_test = create_async_engine(TEST_DATABASE_URL, echo=True)
+instrument_queries(engine_test)
 
 async_session_test = sessionmaker(
     engine_test,
@@ -47,6 +52,12 @@ async def prepate_database():
         await conn.run_sync(metadata.drop_all)
 
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    # тесты меняют данные и в обход actions, которые сбрасывают кеш
+    response_cache.clear()
+
+
 @pytest.fixture(scope="session")
 def event_loop(request):
     loop = asyncio.get_event_loop_policy().new_event_loop()
@@ -122,3 +133,77 @@ async def get_count_users():
         query = select(func.count()).select_from(User)
         count_users_in_database = await session.scalar(query)
     return count_users_in_database
+
+
+# сколько раз должен повториться один и тот же SQL, чтобы считать его N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+
+class QueryCounter:
+    """
+    Список SQL запросов, выполненных в тестовой БД
+    """
+
+    def __init__(self):
+        self.statements: list[str] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context,
+                 executemany):
+        self.statements.append(statement)
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, threshold: int) -> dict[str, int]:
+        """
+        Одинаковые запросы, выполненные не меньше threshold раз
+        """
+
+        return {
+            statement: count
+            for statement, count in Counter(self.statements).items()
+            if count >= threshold
+        }
+
+    def report(self) -> str:
+        return "\n".join(
+            f"{number}. {statement}"
+            for number, statement in enumerate(self.statements, start=1)
+        )
+
+
+@contextmanager
+def assert_max_queries(
+    limit: int,
+    n_plus_one_threshold: int = N_PLUS_ONE_THRESHOLD
+):
+    """
+    Проверка, что внутри блока выполнено не больше limit SQL запросов
+    и ни один запрос не повторяется n_plus_one_threshold раз
+    """
+
+    counter = QueryCounter()
+    event.listen(engine_test.sync_engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(
+            engine_test.sync_engine, "before_cursor_execute", counter
+        )
+
+    repeated = counter.repeated(n_plus_one_threshold)
+    assert not repeated, "Подозрение на N+1:\n" + "\n".join(
+        f"{count}x {statement}" for statement, count in repeated.items()
+    )
+    assert len(counter) <= limit, (
+        f"Выполнено {len(counter)} запросов вместо {limit}:\n"
+        f"{counter.report()}"
+    )
+
+
+async def get_salaries(*user_ids: uuid.UUID) -> dict[uuid.UUID, Salary]:
+    session: AsyncSession = async_session_test()
+    async with session.begin():
+        query = select(Salary).where(Salary.user_id.in_(user_ids))
+        salaries = await session.scalars(query)
+        return {salary.user_id: salary for salary in salaries}
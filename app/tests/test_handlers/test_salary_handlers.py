@@ -1,13 +1,34 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+
+import msgpack
+import pytest
+from fastapi import HTTPException
 from httpx import AsyncClient
-from sqlalchemy import select
+from sqlalchemy import event, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.schemas import GetSalary, GetUser
-from db.models import Salary, User
+from api.actions.salary_actions import update_user_salary_action
+from api.actions.user_actions import principal_cache
+from api.schemas import (
+    GetSalary,
+    GetSalaryHistory,
+    GetSalaryStats,
+    GetUser,
+    UpdateSalary
+)
+from db.models import Salary, SalaryHistory, User
+from db.partitions import month_bounds
 from tests.conftest import (
+    assert_max_queries,
     async_session_test,
     check_schemas,
-    create_test_token
+    engine_test,
+    create_test_token,
+    get_salaries
 )
 
 
@@ -20,10 +41,11 @@ async def test_get_salary_me(
     """
 
     user_token = await create_test_token(user_id=user.id)
-    response = await async_client.get(
-        url="/salary/me/",
-        headers={"Authorization": f"bearer {user_token}"}
-    )
+    with assert_max_queries(1):
+        response = await async_client.get(
+            url="/salary/me/",
+            headers={"Authorization": f"bearer {user_token}"}
+        )
 
     assert response.status_code == 200
     assert response.json()["id"] == str(user.salary.id)
@@ -33,6 +55,31 @@ async def test_get_salary_me(
     ) is True
 
 
+async def test_get_salary_me_msgpack(
+    user: User,
+    async_client: AsyncClient,
+):
+    """
+    Тестирование получения своей ЗП в формате msgpack
+    """
+
+    user_token = await create_test_token(user_id=user.id)
+    response = await async_client.get(
+        url="/salary/me/",
+        headers={
+            "Authorization": f"bearer {user_token}",
+            "Accept": "application/msgpack"
+        }
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    assert response.headers["vary"] == "Accept"
+    content = msgpack.unpackb(response.content)
+    assert content["id"] == str(user.salary.id)
+    assert await check_schemas(instance=content, schema=GetSalary) is True
+
+
 async def test_get_salary_user(
     user: User,
     admin: User,
@@ -47,10 +94,11 @@ async def test_get_salary_user(
 
     bad_uuid = "ba80c512-e114-43be-88da-0ea37b2c8a31"
 
-    response_admin_good = await async_client.get(
-        url=f"/salary/{str(user.id)}/",
-        headers={"Authorization": f"bearer {admin_token}"}
-    )
+    with assert_max_queries(2):
+        response_admin_good = await async_client.get(
+            url=f"/salary/{str(user.id)}/",
+            headers={"Authorization": f"bearer {admin_token}"}
+        )
     response_admin_bad = await async_client.get(
         url=f"/salary/{bad_uuid}/",
         headers={"Authorization": f"bearer {admin_token}"}
@@ -80,6 +128,65 @@ async def test_get_salary_user(
     }
 
 
+async def test_get_salary_etag(
+    user: User,
+    admin: User,
+    async_client: AsyncClient
+):
+    """
+    Тестирование условных запросов зарплаты по ETag
+    """
+
+    user_headers = {
+        "Authorization": f"bearer {await create_test_token(user_id=user.id)}"
+    }
+    admin_headers = {
+        "Authorization": f"bearer {await create_test_token(user_id=admin.id)}"
+    }
+
+    response_me = await async_client.get(
+        url="/salary/me/", headers=user_headers
+    )
+    etag = response_me.headers["etag"]
+    with assert_max_queries(1):
+        response_me_not_modified = await async_client.get(
+            url="/salary/me/",
+            headers={**user_headers, "If-None-Match": etag}
+        )
+    # пользователь из токена и одна версия зарплаты
+    with assert_max_queries(2):
+        response_user_not_modified = await async_client.get(
+            url=f"/salary/{str(user.id)}/",
+            headers={**admin_headers, "If-None-Match": etag}
+        )
+    await async_client.patch(
+        url=f"/salary/{str(user.id)}/",
+        json={"current_salary": 123456},
+        headers=admin_headers
+    )
+    response_me_modified = await async_client.get(
+        url="/salary/me/",
+        headers={**user_headers, "If-None-Match": etag}
+    )
+    response_user_modified = await async_client.get(
+        url=f"/salary/{str(user.id)}/",
+        headers={**admin_headers, "If-None-Match": etag}
+    )
+
+    assert response_me.status_code == 200
+    assert etag.startswith('W/"')
+    assert response_me_not_modified.status_code == 304
+    assert response_me_not_modified.content == b""
+    assert response_me_not_modified.headers["etag"] == etag
+    assert response_user_not_modified.status_code == 304
+    assert response_me_modified.status_code == 200
+    assert response_me_modified.json()["current_salary"] == 123456
+    assert response_me_modified.headers["etag"] != etag
+    assert response_user_modified.status_code == 200
+    assert (response_user_modified.headers["etag"] ==
+            response_me_modified.headers["etag"])
+
+
 async def test_patch_salary_user(
     user: User,
     admin: User,
@@ -113,11 +220,14 @@ async def test_patch_salary_user(
 
     user_salary_after_user_response = salary.current_salary
 
-    response_admin = await async_client.patch(
-        url=f"/salary/{str(user.id)}/",
-        json=body,
-        headers={"Authorization": f"bearer {admin_token}"}
-    )
+    # аутентификация, создание секции истории (SAVEPOINT, CREATE TABLE,
+    # RELEASE) и сам UPDATE
+    with assert_max_queries(5):
+        response_admin = await async_client.patch(
+            url=f"/salary/{str(user.id)}/",
+            json=body,
+            headers={"Authorization": f"bearer {admin_token}"}
+        )
 
     async with session.begin():
         query = select(Salary).where(Salary.user_id == user.id)
@@ -140,3 +250,423 @@ async def test_patch_salary_user(
 
     assert (user_salary_before_response == user_salary_after_user_response !=
             user_salary_after_admin_response)
+
+
+async def test_patch_salary_one_query(
+    user: User,
+    admin: User,
+    async_client: AsyncClient
+):
+    """
+    Тестирование изменения ЗП одним запросом: UPDATE ... FROM users
+    и запись истории через CTE
+    """
+
+    admin_token = await create_test_token(user_id=admin.id)
+    unknown_id = uuid.uuid4()
+
+    response_unknown = await async_client.patch(
+        url=f"/salary/{str(unknown_id)}/",
+        json={"current_salary": 1},
+        headers={"Authorization": f"bearer {admin_token}"}
+    )
+
+    session: AsyncSession = async_session_test()
+    try:
+        # секция истории текущего месяца создается первым изменением
+        await update_user_salary_action(
+            user_id=user.id,
+            body=UpdateSalary(current_salary=111000),
+            session=session
+        )
+        await session.commit()
+        history_query = (
+            select(SalaryHistory)
+            .where(SalaryHistory.user_id == user.id)
+            .order_by(SalaryHistory.effective_date, SalaryHistory.id)
+        )
+        history_before = (await session.scalars(history_query)).all()
+        await session.commit()
+
+        with assert_max_queries(1):
+            updated_user = await update_user_salary_action(
+                user_id=user.id,
+                body=UpdateSalary(
+                    current_salary=222000,
+                    increase_date=datetime(2038, 1, 1)
+                ),
+                session=session
+            )
+        await session.commit()
+        history_after = (await session.scalars(history_query)).all()
+
+        with assert_max_queries(1):
+            with pytest.raises(HTTPException) as unknown_error:
+                await update_user_salary_action(
+                    user_id=unknown_id,
+                    body=UpdateSalary(current_salary=1),
+                    session=session
+                )
+        await session.rollback()
+    finally:
+        await session.close()
+
+    assert response_unknown.status_code == 404
+    assert unknown_error.value.status_code == 404
+
+    assert updated_user.id == user.id
+    assert updated_user.salary.current_salary == 222000
+    assert updated_user.salary.increase_date == datetime(2038, 1, 1)
+    # ровно одна новая запись истории, предыдущая хранит старое значение
+    assert len(history_after) == len(history_before) + 1
+    old_record, new_record = history_after[-2:]
+    assert old_record.current_salary == 111000
+    assert new_record.current_salary == 222000
+    assert new_record.increase_date == datetime(2038, 1, 1)
+
+
+async def test_patch_salary_single_transaction(
+    user: User,
+    admin: User,
+    async_client: AsyncClient
+):
+    """
+    Тестирование, что изменение ЗП выполняется в одной транзакции
+    вместе с аутентификацией
+    """
+
+    admin_token = await create_test_token(user_id=admin.id)
+    principal_cache.clear()
+    transactions = []
+
+    def on_begin(connection):
+        transactions.append(connection)
+
+    event.listen(engine_test.sync_engine, "begin", on_begin)
+    try:
+        response = await async_client.patch(
+            url=f"/salary/{str(user.id)}/",
+            json={"current_salary": 300},
+            headers={"Authorization": f"bearer {admin_token}"}
+        )
+    finally:
+        event.remove(engine_test.sync_engine, "begin", on_begin)
+
+    assert response.status_code == 200
+    assert len(transactions) == 1
+    salaries = await get_salaries(user.id)
+    assert salaries[user.id].current_salary == 300
+
+
+async def test_get_salary_me_principal_cache(
+    user: User,
+    admin: User,
+    async_client: AsyncClient,
+):
+    """
+    Тестирование кеша пользователей, полученных по токену
+    """
+
+    principal_cache.clear()
+    user_token = await create_test_token(user_id=user.id)
+    admin_token = await create_test_token(user_id=admin.id)
+    headers = {"Authorization": f"bearer {user_token}"}
+
+    await async_client.get(url="/salary/me/", headers=headers)
+    hits_before = principal_cache.hits
+    await async_client.get(url="/salary/me/", headers=headers)
+
+    await async_client.patch(
+        url=f"/salary/{str(user.id)}/",
+        json={"current_salary": 200000},
+        headers={"Authorization": f"bearer {admin_token}"}
+    )
+    response_after_patch = await async_client.get(
+        url="/salary/me/", headers=headers
+    )
+
+    assert principal_cache.hits == hits_before + 1
+    assert response_after_patch.status_code == 200
+    assert response_after_patch.json()["current_salary"] == 200000
+
+
+async def test_patch_salaries_bulk(
+    user: User,
+    admin: User,
+    async_client: AsyncClient,
+):
+    """
+    Тестирование массового изменения зарплат
+    """
+
+    admin_token = await create_test_token(user_id=admin.id)
+    user_token = await create_test_token(user_id=user.id)
+    bad_uuid = "ba80c512-e114-43be-88da-0ea37b2c8a31"
+
+    body = [
+        {"user_id": str(user.id), "current_salary": 300000},
+        {
+            "user_id": str(admin.id),
+            "current_salary": 400000,
+            "increase_date": "2036-01-01T00:00:00",
+        },
+        {"user_id": bad_uuid, "current_salary": 1},
+    ]
+
+    response_user = await async_client.patch(
+        url="/salary/bulk/",
+        json=body,
+        headers={"Authorization": f"bearer {user_token}"}
+    )
+    response_atomic = await async_client.patch(
+        url="/salary/bulk/",
+        params={"atomic": "true"},
+        json=body,
+        headers={"Authorization": f"bearer {admin_token}"}
+    )
+    salaries_after_atomic = await get_salaries(user.id, admin.id)
+
+    with assert_max_queries(6):
+        response = await async_client.patch(
+            url="/salary/bulk/",
+            json=body,
+            headers={"Authorization": f"bearer {admin_token}"}
+        )
+    salaries_after = await get_salaries(user.id, admin.id)
+
+    assert response_user.status_code == 403
+
+    assert response_atomic.status_code == 404
+    assert response_atomic.json()["detail"]["missing"] == [bad_uuid]
+    assert salaries_after_atomic[user.id].current_salary != 300000
+
+    assert response.status_code == 200
+    assert response.json() == {"updated": 2, "missing": [bad_uuid]}
+    assert salaries_after[user.id].current_salary == 300000
+    assert salaries_after[admin.id].current_salary == 400000
+    assert salaries_after[admin.id].increase_date.year == 2036
+
+
+async def test_patch_salaries_bulk_without_dates(
+    user: User,
+    admin: User,
+    async_client: AsyncClient,
+):
+    """
+    Тестирование массового изменения, в котором ни у одной записи нет
+    даты повышения или зарплаты
+    """
+
+    admin_token = await create_test_token(user_id=admin.id)
+    salaries_before = await get_salaries(user.id, admin.id)
+
+    response = await async_client.patch(
+        url="/salary/bulk/",
+        json=[
+            {"user_id": str(user.id), "current_salary": 310000},
+            {"user_id": str(admin.id), "current_salary": 410000},
+        ],
+        headers={"Authorization": f"bearer {admin_token}"}
+    )
+    salaries_after = await get_salaries(user.id, admin.id)
+    # и наоборот: только даты, без зарплат
+    response_dates = await async_client.patch(
+        url="/salary/bulk/",
+        json=[{"user_id": str(user.id), "increase_date": "2037-01-01"}],
+        headers={"Authorization": f"bearer {admin_token}"}
+    )
+    salaries_after_dates = await get_salaries(user.id)
+
+    assert response.status_code == 200
+    assert response.json() == {"updated": 2, "missing": []}
+    for user_id, current_salary in ((user.id, 310000), (admin.id, 410000)):
+        assert salaries_after[user_id].current_salary == current_salary
+        assert (
+            salaries_after[user_id].increase_date
+            == salaries_before[user_id].increase_date
+        )
+
+    assert response_dates.status_code == 200
+    assert salaries_after_dates[user.id].current_salary == 310000
+    assert salaries_after_dates[user.id].increase_date.year == 2037
+
+
+async def test_get_salary_history(
+    user: User,
+    admin: User,
+    async_client: AsyncClient,
+):
+    """
+    Тестирование получения истории зарплаты пользователя
+    """
+
+    admin_token = await create_test_token(user_id=admin.id)
+    user_token = await create_test_token(user_id=user.id)
+    headers = {"Authorization": f"bearer {admin_token}"}
+
+    started = datetime.utcnow().isoformat()
+    for current_salary in (110000, 120000, 130000):
+        await async_client.patch(
+            url=f"/salary/{str(user.id)}/",
+            json={"current_salary": current_salary},
+            headers=headers
+        )
+
+    with assert_max_queries(2):
+        first_page = await async_client.get(
+            url=f"/salary/{str(user.id)}/history/",
+            params={"from": started, "limit": 2},
+            headers=headers
+        )
+    second_page = await async_client.get(
+        url=f"/salary/{str(user.id)}/history/",
+        params={
+            "from": started,
+            "limit": 2,
+            "cursor": first_page.headers["X-Next-Cursor"],
+        },
+        headers=headers
+    )
+    empty_page = await async_client.get(
+        url=f"/salary/{str(user.id)}/history/",
+        params={"to": started},
+        headers=headers
+    )
+    response_user = await async_client.get(
+        url=f"/salary/{str(user.id)}/history/",
+        headers={"Authorization": f"bearer {user_token}"}
+    )
+
+    history = first_page.json() + second_page.json()
+
+    assert first_page.status_code == 200
+    assert [record["current_salary"] for record in history] == [
+        110000, 120000, 130000
+    ]
+    assert "X-Next-Cursor" not in second_page.headers
+    assert await check_schemas(instance=history[0], schema=GetSalaryHistory)
+    assert all(
+        record["effective_date"] < started for record in empty_page.json()
+    )
+    assert response_user.status_code == 403
+
+
+async def test_get_salary_stats(
+    user: User,
+    admin: User,
+    async_client: AsyncClient
+):
+    """
+    Тестирование сводки по зарплатам, поддерживаемой триггерами
+    """
+
+    admin_headers = {
+        "Authorization": f"bearer {await create_test_token(user_id=admin.id)}"
+    }
+    month_start, month_end = month_bounds(datetime.utcnow())
+    await async_client.patch(
+        url=f"/salary/{str(user.id)}/",
+        json={
+            "current_salary": 100000,
+            "increase_date": month_start.isoformat()
+        },
+        headers=admin_headers
+    )
+
+    # пользователь из токена, скетч и повышения по месяцам
+    with assert_max_queries(3):
+        response = await async_client.get(
+            url="/salary/stats/", headers=admin_headers
+        )
+    session: AsyncSession = async_session_test()
+    async with session.begin():
+        count, total, median = (await session.execute(
+            select(
+                func.count(Salary.current_salary),
+                func.sum(Salary.current_salary),
+                func.percentile_disc(0.5).within_group(Salary.current_salary)
+            )
+        )).one()
+        raises = await session.scalar(
+            select(func.count()).where(
+                Salary.increase_date >= month_start,
+                Salary.increase_date < month_end
+            )
+        )
+    stats = response.json()
+
+    assert response.status_code == 200
+    assert await check_schemas(instance=stats, schema=GetSalaryStats) is True
+    assert stats["count"] == count
+    assert abs(stats["total"] - total) < 1e-6 * total
+    assert abs(stats["p50"] - median) <= stats["relative_accuracy"] * median
+    assert stats["upcoming_raises"][0]["raises"] == raises
+
+    await async_client.patch(
+        url=f"/salary/{str(user.id)}/",
+        json={"current_salary": 200000},
+        headers=admin_headers
+    )
+    response_after_update = await async_client.get(
+        url="/salary/stats/", headers=admin_headers
+    )
+
+    assert response_after_update.json()["count"] == count
+    assert (abs(response_after_update.json()["total"] - total - 100000) <
+            1e-6 * total)
+
+
+async def test_export_salaries(
+    user: User,
+    admin: User,
+    async_client: AsyncClient
+):
+    """
+    Тестирование потоковой выгрузки зарплат в CSV и NDJSON
+    """
+
+    user_headers = {
+        "Authorization": f"bearer {await create_test_token(user_id=user.id)}"
+    }
+    admin_headers = {
+        "Authorization": f"bearer {await create_test_token(user_id=admin.id)}"
+    }
+    session: AsyncSession = async_session_test()
+    async with session.begin():
+        count = await session.scalar(select(func.count(Salary.id)))
+
+    response_csv = await async_client.get(
+        url="/salary/export/",
+        headers={**admin_headers, "Accept-Encoding": "identity"}
+    )
+    # httpx сам распаковывает gzip
+    response_ndjson = await async_client.get(
+        url="/salary/export/",
+        params={"format": "ndjson"},
+        headers={**admin_headers, "Accept-Encoding": "gzip"}
+    )
+    response_bad_format = await async_client.get(
+        url="/salary/export/", params={"format": "xml"}, headers=admin_headers
+    )
+    response_user = await async_client.get(
+        url="/salary/export/", headers=user_headers
+    )
+
+    rows = list(csv.DictReader(io.StringIO(response_csv.text)))
+    lines = [json.loads(line) for line in response_ndjson.text.splitlines()]
+
+    assert response_csv.status_code == 200
+    assert response_csv.headers["content-type"].startswith("text/csv")
+    assert "content-encoding" not in response_csv.headers
+    assert len(rows) == count
+    assert str(user.id) in {row["user_id"] for row in rows}
+
+    assert response_ndjson.status_code == 200
+    assert response_ndjson.headers["content-encoding"] == "gzip"
+    assert len(lines) == count
+    assert [line["user_id"] for line in lines] == [
+        row["user_id"] for row in rows
+    ]
+
+    assert response_bad_format.status_code == 422
+    assert response_user.status_code == 403
@@ -1,15 +1,25 @@
+import json
+import uuid
+
+import pytest
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from api.actions import user_actions
+from api.handlers import user_handlers
 from api.schemas import GetToken, GetUser
 from db.models import User
+from settings import PAGE_MAX_SIZE
 from tests.conftest import (
+    assert_max_queries,
     async_session_test,
     check_schemas,
     create_test_token,
-    get_count_users
+    get_count_users,
+    get_salaries
 )
-from utils.hashing import Hasher
+from utils.hashing import Hasher, hashing_service
+from utils.rate_limit import LoginGuard, TokenBucketLimiter
 
 
 async def test_get_users(
@@ -24,10 +34,11 @@ async def test_get_users(
     admin_token = await create_test_token(user_id=admin.id)
 
     user_token = await create_test_token(user_id=user.id)
-    response_admin = await async_client.get(
-        url="/users/",
-        headers={"Authorization": f"bearer {admin_token}"}
-    )
+    with assert_max_queries(2):
+        response_admin = await async_client.get(
+            url="/users/",
+            headers={"Authorization": f"bearer {admin_token}"}
+        )
     response_user = await async_client.get(
         url="/users/",
         headers={"Authorization": f"bearer {user_token}"}
@@ -48,6 +59,101 @@ async def test_get_users(
     }
 
 
+async def test_get_users_response_cache(
+        admin: User,
+        async_client: AsyncClient,
+):
+    """
+    Тестирование кеша ответов списка пользователей и его сброса
+    """
+
+    admin_token = await create_test_token(user_id=admin.id)
+    headers = {"Authorization": f"bearer {admin_token}"}
+    params = {"limit": PAGE_MAX_SIZE}
+
+    response_first = await async_client.get(
+        url="/users/", params=params, headers=headers
+    )
+    # только пользователь из токена, сама страница берется из кеша
+    with assert_max_queries(1):
+        response_cached = await async_client.get(
+            url="/users/", params=params, headers=headers
+        )
+    response_created = await async_client.post(url="/users/", json={
+        "username": "cacheuser",
+        "email": "cacheuser@mail.ru",
+        "password": "cacheuser",
+        "first_name": "Иван",
+        "last_name": "Иванов",
+    })
+    response_after_create = await async_client.get(
+        url="/users/", params=params, headers=headers
+    )
+    await async_client.delete(
+        url=f"/users/{response_created.json()['id']}/", headers=headers
+    )
+    response_after_delete = await async_client.get(
+        url="/users/", params=params, headers=headers
+    )
+
+    assert response_cached.status_code == 200
+    assert response_cached.content == response_first.content
+    assert response_created.status_code == 201
+    assert len(response_after_create.json()) == len(response_first.json()) + 1
+    assert response_after_delete.content == response_first.content
+
+
+async def test_get_users_pagination(
+        admin: User,
+        user: User,
+        async_client: AsyncClient,
+):
+    """
+    Тестирование постраничного и потокового получения пользователей
+    """
+
+    admin_token = await create_test_token(user_id=admin.id)
+    headers = {"Authorization": f"bearer {admin_token}"}
+    count_users_in_database = await get_count_users()
+
+    pages = []
+    params = {"limit": 1}
+    while True:
+        with assert_max_queries(2):
+            response = await async_client.get(
+                url="/users/", params=params, headers=headers
+            )
+        assert response.status_code == 200
+        pages.append(response.json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if next_cursor is None:
+            break
+        params = {"limit": 1, "cursor": next_cursor}
+
+    with assert_max_queries(2):
+        response_ndjson = await async_client.get(
+            url="/users/",
+            headers={**headers, "Accept": "application/x-ndjson"}
+        )
+    response_bad_cursor = await async_client.get(
+        url="/users/", params={"cursor": "bad"}, headers=headers
+    )
+
+    ids = [user["id"] for page in pages for user in page]
+    ndjson_rows = [
+        json.loads(line) for line in response_ndjson.text.splitlines()
+    ]
+
+    assert len(ids) == len(set(ids)) == count_users_in_database
+    assert response_ndjson.status_code == 200
+    assert (response_ndjson.headers["content-type"] ==
+            "application/x-ndjson")
+    assert [row["id"] for row in ndjson_rows] == ids
+    assert await check_schemas(instance=ndjson_rows[0], schema=GetUser)
+    assert response_bad_cursor.status_code == 422
+    assert response_bad_cursor.json() == {"detail": "Некорректный курсор"}
+
+
 async def test_create_user(
         async_client: AsyncClient,
 ):
@@ -81,10 +187,11 @@ async def test_create_user(
     body_with_incorrect_last_name = body.copy()
     body_with_incorrect_last_name["last_name"] = "Ivanov"
 
-    good_response = await async_client.post(
-        url="/users/",
-        json=body,
-    )
+    with assert_max_queries(1):
+        good_response = await async_client.post(
+            url="/users/",
+            json=body,
+        )
 
     bad_response_without_username = await async_client.post(
         url="/users/",
@@ -170,6 +277,140 @@ async def test_create_user(
     assert count_users_in_database_before + 1 == count_users_in_database_after
 
 
+async def test_create_user_salary_version(
+        async_client: AsyncClient,
+):
+    """
+    Тестирование начальной версии зарплаты при регистрации
+    """
+
+    response = await async_client.post(
+        url="/users/",
+        json={
+            "username": "versionuser",
+            "email": "versionuser@mail.ru",
+            "password": "versionuser",
+            "first_name": "Иван",
+            "last_name": "Иванов",
+        }
+    )
+    assert response.status_code == 201
+
+    user_id = uuid.UUID(response.json()["id"])
+    salaries = await get_salaries(user_id)
+    assert salaries[user_id].version == 1
+
+
+async def test_create_user_conflicts(
+        async_client: AsyncClient,
+):
+    """
+    Тестирование регистрации с занятыми username и email
+    """
+
+    body = {
+        "username": "conflictuser",
+        "email": "conflictuser@mail.ru",
+        "password": "conflictuser",
+        "first_name": "Иван",
+        "last_name": "Иванов",
+    }
+
+    good_response = await async_client.post(url="/users/", json=body)
+    count_users_in_database_before = await get_count_users()
+
+    with assert_max_queries(1):
+        response_same_username = await async_client.post(
+            url="/users/",
+            json={**body, "email": "otheremail@mail.ru"}
+        )
+    response_same_email = await async_client.post(
+        url="/users/",
+        json={**body, "username": "otherusername"}
+    )
+    count_users_in_database_after = await get_count_users()
+
+    assert good_response.status_code == 201
+    assert good_response.json()["salary"]["current_salary"] is None
+
+    assert response_same_username.status_code == 422
+    assert response_same_username.json() == {
+        "detail": "Пользователь с данным username уже существует"
+    }
+    assert response_same_email.status_code == 422
+    assert response_same_email.json() == {
+        "detail": "Пользователь с данным email уже существует"
+    }
+    assert count_users_in_database_before == count_users_in_database_after
+
+
+async def test_create_users_bulk(
+        admin: User,
+        user: User,
+        async_client: AsyncClient,
+):
+    """
+    Тестирование массового создания пользователей
+    """
+
+    admin_token = await create_test_token(user_id=admin.id)
+    user_token = await create_test_token(user_id=user.id)
+    count_users_in_database_before = await get_count_users()
+
+    def make_body(username: str) -> dict:
+        return {
+            "username": username,
+            "email": f"{username}@mail.ru",
+            "password": username,
+            "first_name": "Иван",
+            "last_name": "Иванов",
+        }
+
+    body = [
+        make_body("bulkuser1"),
+        make_body("bulkuser2"),
+        make_body("bulkuser1"),
+        {**make_body("bulkuser3"), "email": user.email},
+        {**make_body("bulkuser4"), "first_name": "Ivan"},
+        {"username": "bulkuser5"},
+    ]
+
+    response_user = await async_client.post(
+        url="/users/bulk/",
+        json=body,
+        headers={"Authorization": f"bearer {user_token}"}
+    )
+    with assert_max_queries(4):
+        response_admin = await async_client.post(
+            url="/users/bulk/",
+            json=body,
+            headers={"Authorization": f"bearer {admin_token}"}
+        )
+    results = response_admin.json()["results"]
+    count_users_in_database_after = await get_count_users()
+
+    assert response_user.status_code == 403
+
+    assert response_admin.status_code == 200
+    assert response_admin.json()["created"] == 2
+    assert response_admin.json()["failed"] == 4
+    assert [result["status"] for result in results] == [
+        "created", "created", "error", "error", "error", "error"
+    ]
+    assert results[0]["id"] is not None
+    assert results[2]["detail"] == (
+        "Пользователь с данным username уже существует"
+    )
+    assert results[3]["detail"] == (
+        "Пользователь с данным email уже существует"
+    )
+    assert results[4]["detail"] == (
+        "Имя и фамилия могут содержать только кириллицу"
+    )
+    assert results[5]["detail"][0]["type"] == "value_error.missing"
+    assert count_users_in_database_before + 2 == count_users_in_database_after
+
+
 async def test_create_token(
         user: User,
         async_client: AsyncClient
@@ -191,9 +432,11 @@ async def test_create_token(
     }
 
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-    response = await async_client.post(
-        url="/users/token/", data=body, headers=headers
-    )
+    # проверка пароля и сохранение refresh токена
+    with assert_max_queries(2):
+        response = await async_client.post(
+            url="/users/token/", data=body, headers=headers
+        )
     bad_response_without_username = await async_client.post(
         url="/users/token/", data=body_without_username, headers=headers
     )
@@ -210,6 +453,7 @@ async def test_create_token(
     assert response.status_code == 200
     assert response.json()["access_token"] is not None
     assert response.json()["token_type"] == "bearer"
+    assert response.json()["refresh_token"] is not None
     assert await check_schemas(
         instance=response.json(), schema=GetToken
     ) is True
@@ -252,6 +496,47 @@ async def test_create_token(
     }
 
 
+async def test_create_token_rate_limit(
+        user: User,
+        async_client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+):
+    """
+    Тестирование ограничения частоты логинов и сброса нагрузки
+    """
+
+    guard = LoginGuard(
+        hashing=hashing_service,
+        ip_limiter=TokenBucketLimiter(rate=1, burst=100, max_keys=10),
+        username_limiter=TokenBucketLimiter(rate=0.01, burst=2, max_keys=10),
+        shed_queue_ratio=0.8,
+        shed_load=0
+    )
+    monkeypatch.setattr(user_handlers, "login_guard", guard)
+    body = {"username": user.username, "password": "password"}
+
+    responses = [
+        await async_client.post(url="/users/token/", data=body)
+        for _ in range(3)
+    ]
+    # другой username не ограничен, но очередь bcrypt переполнена
+    monkeypatch.setattr(
+        hashing_service.lanes[hashing_service.LOGIN], "waiting", 1000
+    )
+    with assert_max_queries(0):
+        response_shed = await async_client.post(
+            url="/users/token/",
+            data={"username": "otheruser", "password": "password"}
+        )
+
+    assert [response.status_code for response in responses] == [
+        401, 401, 429
+    ]
+    assert int(responses[2].headers["Retry-After"]) > 0
+    assert response_shed.status_code == 429
+    assert response_shed.headers["Retry-After"] == "1"
+
+
 async def test_delete_user(
     admin: User,
     user: User,
@@ -283,10 +568,11 @@ async def test_delete_user(
         headers={"Authorization": f"bearer {user_token}"}
     )
 
-    response_admin = await async_client.delete(
-        url=f"/users/{str(user_for_delete.id)}/",
-        headers={"Authorization": f"bearer {admin_token}"}
-    )
+    with assert_max_queries(2):
+        response_admin = await async_client.delete(
+            url=f"/users/{str(user_for_delete.id)}/",
+            headers={"Authorization": f"bearer {admin_token}"}
+        )
     response_admin_with_incorrect_uuid = await async_client.delete(
         url=f"/users/{str(user_for_delete.id)}/",
         headers={"Authorization": f"bearer {admin_token}"}
@@ -305,3 +591,118 @@ async def test_delete_user(
         'detail': f'Пользователь с uuid {str(user_for_delete.id)} не найден'
     }
     assert count_users_before_delete == count_users_after_delete + 1
+
+
+async def test_stateless_auth_and_revoke_tokens(
+    admin: User,
+    user: User,
+    async_client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """
+    Тестирование stateless аутентификации и отзыва токенов
+    """
+
+    monkeypatch.setattr(user_actions, "AUTH_MODE", "stateless")
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+    admin_token = (await async_client.post(
+        url="/users/token/",
+        data={"username": admin.username, "password": "admin"},
+        headers=headers
+    )).json()["access_token"]
+    user_token = (await async_client.post(
+        url="/users/token/",
+        data={"username": user.username, "password": "user"},
+        headers=headers
+    )).json()["access_token"]
+    # токен без роли и версии в stateless режиме не принимается
+    legacy_token = await create_test_token(user_id=user.id)
+
+    response_before_revoke = await async_client.get(
+        url="/salary/me/",
+        headers={"Authorization": f"bearer {user_token}"}
+    )
+    response_legacy = await async_client.get(
+        url="/salary/me/",
+        headers={"Authorization": f"bearer {legacy_token}"}
+    )
+    response_user_revoke = await async_client.post(
+        url=f"/users/{str(user.id)}/revoke-tokens/",
+        headers={"Authorization": f"bearer {user_token}"}
+    )
+    # обновление версий токенов, проверка версии и сам отзыв
+    with assert_max_queries(3):
+        response_admin_revoke = await async_client.post(
+            url=f"/users/{str(user.id)}/revoke-tokens/",
+            headers={"Authorization": f"bearer {admin_token}"}
+        )
+    response_after_revoke = await async_client.get(
+        url="/salary/me/",
+        headers={"Authorization": f"bearer {user_token}"}
+    )
+
+    assert response_before_revoke.status_code == 200
+    assert response_before_revoke.json()["id"] == str(user.salary.id)
+    assert response_legacy.status_code == 401
+    assert response_user_revoke.status_code == 403
+    assert response_admin_revoke.status_code == 204
+    assert response_after_revoke.status_code == 401
+    assert response_after_revoke.json() == {"detail": "Невалидный токен"}
+
+
+async def test_refresh_and_revoke_refresh_token(
+    user: User,
+    async_client: AsyncClient,
+):
+    """
+    Тестирование обновления токена по refresh токену и его отзыва
+    """
+
+    refresh_token = (await async_client.post(
+        url="/users/token/",
+        data={"username": user.username, "password": "user"},
+        headers={'Content-Type': 'application/x-www-form-urlencoded'}
+    )).json()["refresh_token"]
+    body = {"refresh_token": refresh_token}
+
+    response_refresh = await async_client.post(
+        url="/users/token/refresh/", json=body
+    )
+    access_token = response_refresh.json()["access_token"]
+    response_salary = await async_client.get(
+        url="/salary/me/",
+        headers={"Authorization": f"bearer {access_token}"}
+    )
+    # непопадание в фильтр отозванных токенов обходится без БД
+    with assert_max_queries(0):
+        response_refresh_again = await async_client.post(
+            url="/users/token/refresh/", json=body
+        )
+    response_forged = await async_client.post(
+        url="/users/token/refresh/",
+        json={"refresh_token": refresh_token[:-2] + "xx"}
+    )
+    response_revoke = await async_client.post(
+        url="/users/token/revoke/", json=body
+    )
+    response_revoke_again = await async_client.post(
+        url="/users/token/revoke/", json={"refresh_token": "unknown"}
+    )
+    response_after_revoke = await async_client.post(
+        url="/users/token/refresh/", json=body
+    )
+
+    assert response_refresh.status_code == 200
+    assert await check_schemas(
+        instance=response_refresh.json(), schema=GetToken
+    ) is True
+    assert response_salary.status_code == 200
+    assert response_refresh_again.status_code == 200
+    assert response_forged.status_code == 401
+    assert response_revoke.status_code == 204
+    assert response_revoke_again.status_code == 404
+    assert response_after_revoke.status_code == 401
+    assert response_after_revoke.json() == {
+        "detail": "Невалидный refresh токен"
+    }
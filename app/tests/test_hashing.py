@@ -0,0 +1,19 @@
+from utils.hashing import HashingService
+
+
+def test_hashing_lanes():
+    """
+    Тестирование разделения процессов хеширования между полосами
+    """
+
+    for pool_size, login, signup in ((1, 1, 1), (2, 1, 1), (8, 6, 2)):
+        service = HashingService(pool_size=pool_size, queue_limit=10)
+        lanes = service.lanes
+        try:
+            assert lanes[service.LOGIN].concurrency == login
+            assert lanes[service.SIGNUP].concurrency == signup
+            # регистрации не занимают процессы логинов
+            assert (lanes[service.LOGIN].executor is not
+                    lanes[service.SIGNUP].executor)
+        finally:
+            service.shutdown()
@@ -0,0 +1,34 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import User
+from tests.conftest import assert_max_queries, async_session_test
+
+
+async def test_assert_max_queries(user: User):
+    """
+    Тестирование подсчета запросов и поиска N+1
+    """
+
+    session: AsyncSession = async_session_test()
+    query = select(User.username).where(User.id == user.id)
+
+    async with session.begin():
+        with assert_max_queries(2) as counter:
+            await session.scalar(query)
+            await session.scalar(query)
+
+        with pytest.raises(AssertionError, match="Выполнено 2 запросов"):
+            with assert_max_queries(1):
+                await session.scalar(query)
+                await session.scalar(query)
+
+        with pytest.raises(AssertionError, match="Подозрение на N\\+1"):
+            with assert_max_queries(10):
+                for _ in range(3):
+                    await session.scalar(query)
+    await session.close()
+
+    assert len(counter) == 2
+    assert counter.repeated(threshold=2) == {counter.statements[0]: 2}
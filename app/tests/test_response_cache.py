@@ -0,0 +1,44 @@
+import uuid
+
+from fastapi import Response
+
+from utils.response_cache import ResponseCache
+
+
+def test_response_cache():
+    """
+    Тестирование поколений и ограничения объема кеша ответов
+    """
+
+    cache = ResponseCache(max_bytes=4096, ttl=60)
+    user_id, other_user_id = uuid.uuid4(), uuid.uuid4()
+
+    stamp = cache.stamp()
+    cache.set("users", "page", Response(b"users"), stamp)
+    cache.set("salary", user_id, Response(b"salary"), stamp, user_id=user_id)
+    cache.set(
+        "salary", other_user_id, Response(b"other"), stamp,
+        user_id=other_user_id
+    )
+    assert cache.get("users", "page").body == b"users"
+    assert cache.get("salary", user_id).body == b"salary"
+
+    # изменение пользователя сбрасывает списки и только его записи
+    cache.invalidate(user_id)
+    assert cache.get("users", "page") is None
+    assert cache.get("salary", user_id) is None
+    assert cache.get("salary", other_user_id).body == b"other"
+
+    # ответ, собранный до изменения, в кеш не попадает
+    stale_stamp = cache.stamp()
+    cache.invalidate()
+    cache.set("users", "page", Response(b"stale"), stale_stamp)
+    assert cache.get("users", "page") is None
+
+    # при превышении объема вытесняются давно не читавшиеся ответы
+    stamp = cache.stamp()
+    for number in range(10):
+        cache.set("users", number, Response(b"x" * 1000), stamp)
+    assert cache.get("users", 0) is None
+    assert cache.get("users", 9) is not None
+    assert cache.stats()["bytes"] <= 4096
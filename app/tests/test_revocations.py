@@ -0,0 +1,72 @@
+import asyncio
+import datetime
+import uuid
+
+from sqlalchemy import delete
+
+from db.models import RefreshTokenRevocation
+from tests.conftest import assert_max_queries, async_session_test
+from utils.revocations import RevocationFilter
+
+
+async def test_revocation_filter_overlap():
+    """
+    Тестирование догрузки отзыва, зафиксированного позже отзыва с большим id
+    """
+
+    revocations = RevocationFilter(
+        capacity=100, error_rate=0.01, refresh_interval=3600,
+        full_refresh_interval=3600, overlap=10
+    )
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    first_token_id, late_token_id = uuid.uuid4(), uuid.uuid4()
+    # id выдаются по порядку, но транзакция с меньшим id
+    # фиксируется позже
+    first_id = 10 ** 12
+    late_id = first_id - 5
+
+    session = async_session_test()
+    try:
+        session.add(RefreshTokenRevocation(
+            id=first_id, token_id=first_token_id, expires_at=expires_at
+        ))
+        await session.commit()
+        await revocations.refresh(session)
+        revoked = revocations.stats()["revoked"]
+
+        session.add(RefreshTokenRevocation(
+            id=late_id, token_id=late_token_id, expires_at=expires_at
+        ))
+        await session.commit()
+        await revocations.refresh(session, force=True)
+
+        assert await revocations.is_revoked(late_token_id, session) is True
+        assert await revocations.is_revoked(first_token_id, session) is True
+        # перечитанный отзыв не добавляется в фильтр второй раз
+        assert revocations.stats()["revoked"] == revoked + 1
+    finally:
+        await session.execute(delete(RefreshTokenRevocation).where(
+            RefreshTokenRevocation.id.in_((first_id, late_id))
+        ))
+        await session.commit()
+        await session.close()
+
+
+async def test_revocation_filter_concurrent_refresh():
+    """
+    Тестирование одновременных обновлений: фильтр перестраивается один раз
+    """
+
+    revocations = RevocationFilter(
+        capacity=100, error_rate=0.01, refresh_interval=3600,
+        full_refresh_interval=3600, overlap=10
+    )
+    sessions = [async_session_test() for _ in range(5)]
+    try:
+        with assert_max_queries(1):
+            await asyncio.gather(
+                *(revocations.refresh(session) for session in sessions)
+            )
+    finally:
+        for session in sessions:
+            await session.close()
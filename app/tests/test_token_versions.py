@@ -0,0 +1,74 @@
+import asyncio
+import uuid
+
+from sqlalchemy import delete, update
+
+from db.models import User
+from tests.conftest import assert_max_queries, async_session_test
+from utils.token_versions import TokenVersionTable
+
+
+async def test_token_versions_overlap():
+    """
+    Тестирование догрузки версии, зафиксированной позже большей версии
+    """
+
+    table = TokenVersionTable(
+        refresh_interval=3600, full_refresh_interval=3600, overlap=10
+    )
+    base = 10 ** 12
+    users = [
+        User(
+            id=uuid.uuid4(),
+            username=f"tokenversion{number}",
+            password="tokenversion",
+            email=f"tokenversion{number}@mail.ru",
+            first_name="Иван",
+            last_name="Иванов",
+            token_version=version
+        )
+        for number, version in enumerate((base, base + 10))
+    ]
+    user_id = users[0].id
+
+    session = async_session_test()
+    try:
+        session.add_all(users)
+        await session.commit()
+        await table.refresh(session)
+
+        # версия выдана раньше base + 10, но зафиксирована позже
+        await session.execute(
+            update(User).where(User.id == user_id)
+            .values(token_version=base + 5)
+        )
+        await session.commit()
+        await table.refresh(session, force=True)
+
+        assert await table.is_current(user_id, base, session) is False
+        assert await table.is_current(user_id, base + 5, session) is True
+    finally:
+        await session.execute(
+            delete(User).where(User.id.in_([user.id for user in users]))
+        )
+        await session.commit()
+        await session.close()
+
+
+async def test_token_versions_concurrent_refresh():
+    """
+    Тестирование одновременных обновлений: запрос к БД выполняет одно
+    """
+
+    table = TokenVersionTable(
+        refresh_interval=3600, full_refresh_interval=3600, overlap=10
+    )
+    sessions = [async_session_test() for _ in range(5)]
+    try:
+        with assert_max_queries(1):
+            await asyncio.gather(
+                *(table.refresh(session) for session in sessions)
+            )
+    finally:
+        for session in sessions:
+            await session.close()
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from utils.tokens import (
+    EDDSA,
+    ES256,
+    HS256,
+    InvalidToken,
+    TokenCodec,
+    get_unverified_claims,
+    load_key
+)
+
+
+def pem(private_key, public: bool = False) -> bytes:
+    if public:
+        return private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+
+
+@pytest.mark.parametrize("alg, material", [
+    (HS256, b"secret"),
+    (ES256, pem(ec.generate_private_key(ec.SECP256R1()))),
+    (EDDSA, pem(ed25519.Ed25519PrivateKey.generate())),
+])
+def test_token_codec(alg: str, material: bytes):
+    """
+    Тестирование создания и проверки токенов каждым алгоритмом
+    """
+
+    codec = TokenCodec(keys=[load_key("main", alg, material)],
+                       active_kid="main")
+    claims = {"sub": "user", "exp": int(time.time()) + 60, "ver": 1}
+
+    token = codec.encode(claims)
+    header, payload, signature = token.split(".")
+    expired = codec.encode({"sub": "user", "exp": int(time.time()) - 1})
+
+    assert codec.decode(token) == claims
+    assert get_unverified_claims(token) == claims
+    with pytest.raises(InvalidToken):
+        codec.decode(f"{header}.{payload}.{signature[::-1]}")
+    with pytest.raises(InvalidToken):
+        codec.decode(expired)
+    with pytest.raises(InvalidToken):
+        codec.decode("not a token")
+
+
+def test_token_codec_rotation():
+    """
+    Тестирование ротации ключей по kid
+    """
+
+    old_key = ed25519.Ed25519PrivateKey.generate()
+    new_key = ec.generate_private_key(ec.SECP256R1())
+    old_codec = TokenCodec(
+        keys=[load_key("old", EDDSA, pem(old_key))], active_kid="old"
+    )
+    codec = TokenCodec(
+        keys=[
+            load_key("new", ES256, pem(new_key)),
+            # старый ключ остается только для проверки
+            load_key("old", EDDSA, pem(old_key, public=True)),
+        ],
+        active_kid="new"
+    )
+    foreign_codec = TokenCodec(
+        keys=[load_key("old", HS256, b"secret")], active_kid="old"
+    )
+    claims = {"sub": "user", "exp": int(time.time()) + 60}
+
+    assert codec.decode(old_codec.encode(claims)) == claims
+    assert codec.decode(codec.encode(claims)) == claims
+    assert [key["kid"] for key in codec.jwks()["keys"]] == ["new", "old"]
+    # чужой алгоритм с известным kid не принимается
+    with pytest.raises(InvalidToken):
+        codec.decode(foreign_codec.encode(claims))
+    with pytest.raises(ValueError):
+        TokenCodec(
+            keys=[load_key("old", EDDSA, pem(old_key, public=True))],
+            active_kid="old"
+        )
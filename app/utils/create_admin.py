@@ -3,7 +3,7 @@ import asyncio
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.models import Salary, User
+from db.models import Salary, User, token_version_seq
 from db.session import async_session
 from utils.hashing import Hasher
 
@@ -29,6 +29,8 @@ async def create_admin():
         else:
             if admin.role != "admin":
                 admin.role = "admin"
+                # роль изменилась - ранее выданные токены недействительны
+                admin.token_version = token_version_seq.next_value()
 
 
 async def main():
@@ -0,0 +1,38 @@
+import uuid
+
+from fastapi import Request, Response
+
+
+def salary_etag(salary_id: uuid.UUID, version: int) -> str:
+    """
+    Слабый ETag зарплаты: одинаков для JSON и msgpack представлений
+    """
+
+    return f'W/"{salary_id.hex}.{version}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Совпадает ли ETag с заголовком If-None-Match (слабое сравнение)
+    """
+
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in header.split(",")
+    )
+
+
+def not_modified(etag: str) -> Response:
+    """
+    Ответ 304 без тела
+    """
+
+    return Response(
+        status_code=304, headers={"ETag": etag, "Vary": "Accept"}
+    )
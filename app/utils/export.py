@@ -0,0 +1,83 @@
+import csv
+import io
+import zlib
+from typing import AsyncIterator, Sequence
+
+from fastapi import Request
+
+from settings import EXPORT_GZIP_LEVEL
+from utils.serialization import NDJSON, dumps_line
+
+
+CSV = "text/csv; charset=utf-8"
+
+EXPORT_FORMATS = {"csv": CSV, "ndjson": NDJSON}
+
+# колонки выгрузки в порядке полей запроса salary_export_query
+EXPORT_COLUMNS = (
+    "user_id", "username", "email", "first_name", "last_name",
+    "salary_id", "current_salary", "increase_date",
+)
+
+
+def encode_csv_header() -> bytes:
+    return (",".join(EXPORT_COLUMNS) + "\r\n").encode()
+
+
+def encode_csv(rows: Sequence[tuple]) -> bytes:
+    """
+    Кусок строк в CSV одной записью в буфер
+    """
+
+    buffer = io.StringIO()
+    # increase_date - последняя колонка, даты пишутся как в JSON
+    csv.writer(buffer).writerows(
+        (*row[:-1], row[-1].isoformat() if row[-1] is not None else None)
+        for row in rows
+    )
+    return buffer.getvalue().encode()
+
+
+def encode_ndjson(rows: Sequence[tuple]) -> bytes:
+    """
+    Кусок строк в NDJSON: datetime orjson кодирует сам, uuid от asyncpg -
+    через default в dumps_line
+    """
+
+    return b"".join(dumps_line(dict(zip(EXPORT_COLUMNS, row))) for row in rows)
+
+
+async def encode_export(
+        chunks: AsyncIterator[Sequence[tuple]],
+        export_format: str
+) -> AsyncIterator[bytes]:
+    if export_format == "csv":
+        yield encode_csv_header()
+        encode = encode_csv
+    else:
+        encode = encode_ndjson
+    async for rows in chunks:
+        yield encode(rows)
+
+
+def accepts_gzip(request: Request) -> bool:
+    return any(
+        encoding.split(";")[0].strip() == "gzip"
+        for encoding in request.headers.get("accept-encoding", "").split(",")
+    )
+
+
+async def gzip_stream(
+        chunks: AsyncIterator[bytes],
+        level: int = EXPORT_GZIP_LEVEL
+) -> AsyncIterator[bytes]:
+    """
+    Сжатие потока в gzip по мере отправки, без накопления всего ответа
+    """
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,5 +1,14 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
 from passlib.context import CryptContext
 
+from settings import HASHING_POOL_SIZE, HASHING_QUEUE_LIMIT
+from utils.metrics import hashing_seconds
+
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -12,3 +21,175 @@ class Hasher:
     @staticmethod
     def hash_password(password: str) -> str:
         return pwd_context.hash(password)
+
+    @staticmethod
+    def hash_passwords(passwords: list[str]) -> list[str]:
+        return [pwd_context.hash(password) for password in passwords]
+
+
+class HashingLane:
+    """
+    Полоса задач хеширования со своими процессами и ограничением длины
+    очереди
+    """
+
+    # сколько последних замеров хранить для расчета перцентилей
+    LATENCY_WINDOW = 1024
+
+    def __init__(self, name: str, concurrency: int, queue_limit: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._executor: ProcessPoolExecutor | None = None
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # пул создается лениво, чтобы не плодить процессы при импорте
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.concurrency)
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func, *args):
+        if self.waiting >= self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Сервис перегружен, повторите попытку позже",
+                headers={"Retry-After": "1"}
+            )
+
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        hashing_started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            finished = time.perf_counter()
+            hashing_seconds.labels(self.name).observe(
+                finished - hashing_started
+            )
+            elapsed = finished - started
+            self.completed += 1
+            self.total_seconds += elapsed
+            self._latencies.append(elapsed)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0.0
+        return {
+            "concurrency": self.concurrency,
+            "queue_limit": self.queue_limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_seconds": (
+                self.total_seconds / self.completed if self.completed else 0.0
+            ),
+            "p99_seconds": p99,
+        }
+
+
+class HashingService:
+    """
+    Асинхронное хеширование паролей в пулах процессов.
+
+    Вход и регистрация идут по разным полосам, у каждой свои процессы:
+    регистрациям отдается четверть pool_size, но не меньше одного
+    процесса, логинам - остальное, тоже не меньше одного. Поэтому поток
+    регистраций не задерживает логины и наоборот, а процессов всего
+    запускается не меньше двух.
+    """
+
+    LOGIN = "login"
+    SIGNUP = "signup"
+
+    def __init__(self, pool_size: int, queue_limit: int):
+        self.pool_size = max(1, pool_size)
+        signup_concurrency = max(1, self.pool_size // 4)
+        login_concurrency = max(1, self.pool_size - signup_concurrency)
+        self.lanes = {
+            self.LOGIN: HashingLane(
+                self.LOGIN, login_concurrency, queue_limit
+            ),
+            self.SIGNUP: HashingLane(
+                self.SIGNUP, signup_concurrency, queue_limit
+            ),
+        }
+
+    async def verify_password(self, password: str, hash_password: str) -> bool:
+        return await self.lanes[self.LOGIN].run(
+            Hasher.verify_password, password, hash_password
+        )
+
+    async def hash_password(self, password: str) -> str:
+        return await self.lanes[self.SIGNUP].run(
+            Hasher.hash_password, password
+        )
+
+    async def hash_passwords(self, passwords: list[str]) -> list[str]:
+        """
+        Хеширование пачки паролей: пачка делится на части по числу
+        доступных полосе процессов, каждая часть хешируется в своем процессе
+        """
+
+        lane = self.lanes[self.SIGNUP]
+        size = -(-len(passwords) // lane.concurrency) or 1
+        chunks = [
+            passwords[start:start + size]
+            for start in range(0, len(passwords), size)
+        ]
+        hashed = await asyncio.gather(*(
+            lane.run(Hasher.hash_passwords, chunk)
+            for chunk in chunks
+        ))
+        return [password for chunk in hashed for password in chunk]
+
+    async def warm_up(self) -> None:
+        """
+        Запуск всех процессов пулов: по одному хешированию в каждом,
+        чтобы первые логины не ждали старта процессов и импорта bcrypt
+        """
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(
+                lane.executor, Hasher.hash_password, "warm-up"
+            )
+            for lane in self.lanes.values()
+            for _ in range(lane.concurrency)
+        ))
+
+    def stats(self) -> dict:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def shutdown(self) -> None:
+        for lane in self.lanes.values():
+            lane.shutdown()
+
+
+hashing_service = HashingService(
+    pool_size=HASHING_POOL_SIZE,
+    queue_limit=HASHING_QUEUE_LIMIT
+)
@@ -0,0 +1,300 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+# границы бакетов гистограмм задержек в секундах
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0
+)
+# границы бакетов количества запросов к БД за один HTTP запрос
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"')
+        )
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _Value:
+    """
+    Значение счетчика или датчика для одного набора меток
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class _HistogramValue:
+    """
+    Гистограмма для одного набора меток.
+
+    Обновление - поиск бакета и несколько сложений без блокировок:
+    обработчики работают в одном потоке событийного цикла
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # последний элемент - бакет +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """
+    Семейство метрик с одинаковым именем и набором меток
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, object] = {}
+        if not labelnames:
+            # метрика без меток выводится сразу, даже без наблюдений
+            self.labels()
+
+    def _new_value(self):
+        return _Value()
+
+    def labels(self, *values):
+        child = self._values.get(values)
+        if child is None:
+            child = self._values.setdefault(values, self._new_value())
+        return child
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} "
+            f"{child.value}"
+            for values, child in list(self._values.items())
+        ]
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        super().__init__(name, documentation, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def samples(self) -> list[str]:
+        lines = []
+        names = (*self.labelnames, "le")
+        for values, child in list(self._values.items()):
+            cumulative = 0
+            bounds = [*self.buckets, "+Inf"]
+            for bound, count in zip(bounds, child.counts):
+                cumulative += count
+                labels = _format_labels(names, (*values, bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {child.sum}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    """
+    Набор метрик, отдаваемых в текстовом формате Prometheus
+    """
+
+    def __init__(self):
+        self._metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Обрабатываемые в данный момент запросы"
+))
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "Обработанные запросы",
+    ("method", "route", "status")
+))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "Время обработки запроса",
+    ("method", "route")
+))
+db_queries_per_request = registry.register(Histogram(
+    "db_queries_per_request", "Количество запросов к БД за HTTP запрос",
+    ("method", "route"), buckets=QUERY_COUNT_BUCKETS
+))
+db_seconds_per_request = registry.register(Histogram(
+    "db_seconds_per_request", "Время запросов к БД за HTTP запрос",
+    ("method", "route")
+))
+db_query_duration_seconds = registry.register(Histogram(
+    "db_query_duration_seconds", "Время выполнения одного запроса к БД"
+))
+hashing_seconds = registry.register(Histogram(
+    "hashing_seconds", "Время работы bcrypt в пуле процессов", ("lane",)
+))
+jwt_seconds = registry.register(Histogram(
+    "jwt_seconds", "Время создания и проверки JWT", ("operation",)
+))
+login_rejected_total = registry.register(Counter(
+    "login_rejected_total",
+    "Логины, отклоненные до проверки пароля (shed, ip, username)",
+    ("reason",)
+))
+response_cache_requests_total = registry.register(Counter(
+    "response_cache_requests_total",
+    "Обращения к кешу ответов (hit, miss)", ("endpoint", "result")
+))
+response_cache_bytes = registry.register(Gauge(
+    "response_cache_bytes", "Объем ответов в кеше"
+))
+response_cache_evictions_total = registry.register(Counter(
+    "response_cache_evictions_total",
+    "Ответы, вытесненные из кеша по объему"
+))
+
+
+class RequestCost:
+    """
+    Затраты на БД в рамках одного HTTP запроса
+    """
+
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+request_cost: ContextVar[RequestCost | None] = ContextVar(
+    "request_cost", default=None
+)
+
+
+def instrument_queries(engine: AsyncEngine) -> None:
+    """
+    Учет количества и времени запросов к БД через события движка
+    """
+
+    # на соединении одновременно выполняется один запрос, поэтому хватает
+    # одной отметки: после ошибки ее перезапишет следующий запрос
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context,
+                       executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context,
+                      executemany):
+        elapsed = time.perf_counter() - conn.info.pop("query_started")
+        db_query_duration_seconds.labels().observe(elapsed)
+        cost = request_cost.get()
+        if cost is not None:
+            cost.queries += 1
+            cost.db_seconds += elapsed
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware, собирающее задержки, коды ответов и затраты на БД
+    по маршрутам.
+
+    Маршрут берется из шаблона пути (/salary/{user_id}/), чтобы количество
+    меток не зависело от параметров запроса
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        cost = RequestCost()
+        token = request_cost.set(cost)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.labels().inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.labels().dec()
+            request_cost.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            http_requests_total.labels(method, path, status).inc()
+            http_request_duration_seconds.labels(method, path).observe(
+                elapsed
+            )
+            db_queries_per_request.labels(method, path).observe(cost.queries)
+            db_seconds_per_request.labels(method, path).observe(
+                cost.db_seconds
+            )
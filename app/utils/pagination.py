@@ -0,0 +1,32 @@
+import base64
+import datetime
+import json
+import uuid
+
+from fastapi import HTTPException
+
+
+def encode_cursor(date: datetime.datetime, id: uuid.UUID) -> str:
+    """
+    Непрозрачный курсор на позицию (date, id)
+    """
+
+    raw = json.dumps([date.isoformat(), str(id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, uuid.UUID]:
+    """
+    Разбор курсора, полученного от клиента
+    """
+
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(cursor + padding)
+        date, id = json.loads(raw)
+        return datetime.datetime.fromisoformat(date), uuid.UUID(id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=422,
+            detail="Некорректный курсор"
+        )
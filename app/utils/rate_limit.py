@@ -0,0 +1,146 @@
+import math
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+from settings import (
+    LOGIN_IP_BURST,
+    LOGIN_IP_PER_MINUTE,
+    LOGIN_LIMITER_MAX_KEYS,
+    LOGIN_SHED_LOAD,
+    LOGIN_SHED_QUEUE_RATIO,
+    LOGIN_USERNAME_BURST,
+    LOGIN_USERNAME_PER_MINUTE
+)
+from utils.hashing import HashingService, hashing_service
+from utils.metrics import login_rejected_total
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket по ключу с ограниченным количеством ключей.
+
+    Ведра хранятся в OrderedDict в порядке последнего обращения: проверка,
+    обновление и вытеснение самого старого ключа выполняются за O(1).
+    Вытесненный ключ при следующем обращении получает полное ведро
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.evictions = 0
+
+    def take(self, key: str) -> float:
+        """
+        Списывает токен с ведра key. Возвращает 0, если запрос разрешен,
+        иначе - через сколько секунд появится следующий токен
+        """
+
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+            self.evictions += 1
+        return retry_after
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class LoginGuard:
+    """
+    Защита /users/token/ до проверки пароля.
+
+    Сначала сбрасывается лишняя нагрузка: если очередь bcrypt заполнена
+    больше чем на shed_queue_ratio или средняя загрузка на ядро выше
+    shed_load, запрос сразу получает 429. Затем проверяются лимиты
+    по IP клиента и по username
+    """
+
+    # как часто перечитывать среднюю загрузку системы
+    LOAD_CHECK_SECONDS = 1.0
+
+    def __init__(
+            self,
+            hashing: HashingService,
+            ip_limiter: TokenBucketLimiter,
+            username_limiter: TokenBucketLimiter,
+            shed_queue_ratio: float,
+            shed_load: float
+    ):
+        self.hashing = hashing
+        self.ip_limiter = ip_limiter
+        self.username_limiter = username_limiter
+        self.shed_queue_ratio = shed_queue_ratio
+        self.shed_load = shed_load
+        self._load = 0.0
+        self._load_checked_at = float("-inf")
+
+    def overloaded(self) -> bool:
+        lane = self.hashing.lanes[HashingService.LOGIN]
+        if lane.waiting >= lane.queue_limit * self.shed_queue_ratio:
+            return True
+        if not self.shed_load:
+            return False
+        now = time.monotonic()
+        if now - self._load_checked_at >= self.LOAD_CHECK_SECONDS:
+            self._load = os.getloadavg()[0] / (os.cpu_count() or 1)
+            self._load_checked_at = now
+        return self._load > self.shed_load
+
+    def check(self, username: str, ip: str | None) -> None | HTTPException:
+        if self.overloaded():
+            self.reject("shed", retry_after=1)
+        if ip is not None:
+            retry_after = self.ip_limiter.take(ip)
+            if retry_after:
+                self.reject("ip", retry_after=retry_after)
+        retry_after = self.username_limiter.take(username)
+        if retry_after:
+            self.reject("username", retry_after=retry_after)
+
+    @staticmethod
+    def reject(reason: str, retry_after: float) -> HTTPException:
+        login_rejected_total.labels(reason).inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Слишком много попыток входа, повторите попытку позже",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+    def stats(self) -> dict:
+        return {
+            "ip_keys": len(self.ip_limiter),
+            "username_keys": len(self.username_limiter),
+            "evictions": (
+                self.ip_limiter.evictions + self.username_limiter.evictions
+            ),
+        }
+
+
+login_guard = LoginGuard(
+    hashing=hashing_service,
+    ip_limiter=TokenBucketLimiter(
+        rate=LOGIN_IP_PER_MINUTE / 60,
+        burst=LOGIN_IP_BURST,
+        max_keys=LOGIN_LIMITER_MAX_KEYS
+    ),
+    username_limiter=TokenBucketLimiter(
+        rate=LOGIN_USERNAME_PER_MINUTE / 60,
+        burst=LOGIN_USERNAME_BURST,
+        max_keys=LOGIN_LIMITER_MAX_KEYS
+    ),
+    shed_queue_ratio=LOGIN_SHED_QUEUE_RATIO,
+    shed_load=LOGIN_SHED_LOAD
+)
@@ -0,0 +1,154 @@
+import time
+import uuid
+from collections import OrderedDict
+from typing import Hashable
+
+from fastapi import Response
+
+from settings import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL_SECONDS
+from utils.metrics import (
+    response_cache_bytes,
+    response_cache_evictions_total,
+    response_cache_requests_total
+)
+
+
+class _Entry:
+    __slots__ = ("body", "status_code", "headers", "user_id", "stamp",
+                 "expires_at", "size")
+
+    def __init__(self, response: Response, user_id: uuid.UUID | None,
+                 stamp: tuple[int, float], ttl: float):
+        self.body = response.body
+        self.status_code = response.status_code
+        # вместе с content-type и content-length, тело уже закодировано
+        self.headers = dict(response.headers)
+        self.user_id = user_id
+        self.stamp = stamp[0]
+        # срок считается от начала чтения данных, а не от записи в кеш
+        self.expires_at = stamp[1] + ttl
+        self.size = len(self.body) + sum(
+            len(name) + len(value) for name, value in self.headers.items()
+        )
+
+
+class ResponseCache:
+    """
+    Кеш готовых ответов, ограниченный суммарным объемом тел в байтах.
+
+    Записи бывают двух видов: общие (списки) и относящиеся к одному
+    пользователю. Вместо поиска и удаления записей изменение данных
+    увеличивает счетчик поколений: общий - при любом изменении
+    пользователей, и пользовательский - для затронутых пользователей.
+    Запись действительна, если она начала собираться позже последнего
+    изменения своей области.
+
+    Метка поколения берется до чтения из БД, поэтому ответ, собранный
+    параллельно с изменением, в кеш уже не попадет. Время жизни
+    ограничивает устаревание из-за изменений в других процессах
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._clock = 0
+        self._global_generation = 0
+        # поколения пользователей в порядке изменения; поколения старше
+        # ttl удаляются, так как все записи до них уже истекли
+        self._user_generations: OrderedDict[
+            uuid.UUID, tuple[int, float]
+        ] = OrderedDict()
+
+    def stamp(self) -> tuple[int, float]:
+        """
+        Метка, которую нужно взять до чтения данных для ответа
+        """
+
+        return self._clock, time.monotonic()
+
+    def _is_valid(self, entry: _Entry) -> bool:
+        if entry.expires_at <= time.monotonic():
+            return False
+        if entry.user_id is None:
+            return entry.stamp >= self._global_generation
+        generation, _ = self._user_generations.get(entry.user_id, (0, 0.0))
+        return entry.stamp >= generation
+
+    def get(self, endpoint: str, key: Hashable) -> Response | None:
+        entry = self._entries.get((endpoint, key))
+        if entry is not None and not self._is_valid(entry):
+            self._remove((endpoint, key))
+            entry = None
+        if entry is None:
+            response_cache_requests_total.labels(endpoint, "miss").inc()
+            return None
+        self._entries.move_to_end((endpoint, key))
+        response_cache_requests_total.labels(endpoint, "hit").inc()
+        return Response(
+            content=entry.body,
+            status_code=entry.status_code,
+            headers=entry.headers
+        )
+
+    def set(
+            self,
+            endpoint: str,
+            key: Hashable,
+            response: Response,
+            stamp: tuple[int, float],
+            user_id: uuid.UUID | None = None
+    ) -> None:
+        entry = _Entry(response, user_id, stamp, self.ttl)
+        if entry.size > self.max_bytes or not self._is_valid(entry):
+            return
+        self._remove((endpoint, key))
+        self._entries[(endpoint, key)] = entry
+        self._bytes += entry.size
+        response_cache_bytes.labels().inc(entry.size)
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            response_cache_evictions_total.labels().inc()
+
+    def _remove(self, full_key: Hashable) -> None:
+        entry = self._entries.pop(full_key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            response_cache_bytes.labels().dec(entry.size)
+
+    def invalidate(self, *user_ids: uuid.UUID) -> None:
+        """
+        Сброс общих записей и записей переданных пользователей
+        """
+
+        self._clock += 1
+        self._global_generation = self._clock
+        now = time.monotonic()
+        for user_id in user_ids:
+            self._user_generations.pop(user_id, None)
+            self._user_generations[user_id] = (self._clock, now)
+        while self._user_generations:
+            _, (_, invalidated_at) = next(iter(
+                self._user_generations.items()
+            ))
+            if now - invalidated_at <= self.ttl:
+                break
+            self._user_generations.popitem(last=False)
+
+    def clear(self) -> None:
+        for full_key in list(self._entries):
+            self._remove(full_key)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+response_cache = ResponseCache(
+    max_bytes=RESPONSE_CACHE_MAX_BYTES,
+    ttl=RESPONSE_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,180 @@
+import asyncio
+import datetime
+import hashlib
+import math
+import time
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import RefreshTokenRevocation
+from settings import (
+    REVOCATION_FILTER_CAPACITY,
+    REVOCATION_FILTER_ERROR_RATE,
+    REVOCATIONS_FULL_REFRESH_SECONDS,
+    REVOCATIONS_REFRESH_SECONDS,
+    REVOCATIONS_WATERMARK_OVERLAP
+)
+
+
+class BloomFilter:
+    """
+    Фильтр Блума над uuid: отвечает "точно нет" или "возможно есть"
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        ))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray(-(-self.size // 8))
+        self.count = 0
+
+    def _positions(self, key: uuid.UUID):
+        # две половины одного хеша дают все k позиций
+        # (Kirsch, Mitzenmacher)
+        digest = hashlib.blake2b(key.bytes, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for number in range(self.hashes):
+            yield (first + number * second) % self.size
+
+    def add(self, key: uuid.UUID) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: uuid.UUID) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class RevocationFilter:
+    """
+    Отозванные refresh токены в памяти.
+
+    Новые отзывы догружаются по возрастающему id раз в refresh_interval,
+    раз в full_refresh_interval фильтр строится заново без истекших
+    токенов. Транзакции фиксируются не в порядке выдачи id, поэтому
+    догрузка перечитывает последние overlap id ниже уже известного
+    максимума, а уже добавленные id пропускаются. Попадание в фильтр
+    перепроверяется по таблице отзывов, поэтому ложное срабатывание стоит
+    одного запроса к БД, а непопадание обходится без БД
+    """
+
+    def __init__(
+            self,
+            capacity: int,
+            error_rate: float,
+            refresh_interval: float,
+            full_refresh_interval: float,
+            overlap: int
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.overlap = overlap
+        self._filter = BloomFilter(capacity, error_rate)
+        self._watermark = 0
+        # id из перечитываемого окна, уже добавленные в фильтр
+        self._recent: set[int] = set()
+        self._refreshed_at = float("-inf")
+        self._full_refreshed_at = float("-inf")
+        self._lock = asyncio.Lock()
+        self.false_positives = 0
+
+    async def refresh(
+            self,
+            session: AsyncSession,
+            force: bool = False
+    ) -> None:
+        now = time.monotonic()
+        full = now - self._full_refreshed_at >= self.full_refresh_interval
+        if not (force or full or
+                now - self._refreshed_at >= self.refresh_interval):
+            return
+
+        async with self._lock:
+            # пока ждали блокировку, фильтр мог обновить другой запрос
+            if self._refreshed_at >= now:
+                return
+            now = time.monotonic()
+            full = now - self._full_refreshed_at >= self.full_refresh_interval
+            query = select(
+                RefreshTokenRevocation.id, RefreshTokenRevocation.token_id
+            )
+            if full:
+                query = query.where(
+                    RefreshTokenRevocation.expires_at >
+                    datetime.datetime.utcnow()
+                )
+            else:
+                query = query.where(
+                    RefreshTokenRevocation.id > self._watermark - self.overlap
+                )
+            rows = (await session.execute(query)).all()
+
+            if full:
+                # с запасом, чтобы до следующей перестройки доля ложных
+                # срабатываний оставалась около error_rate
+                self._filter = BloomFilter(
+                    max(self.capacity, 2 * len(rows)), self.error_rate
+                )
+                self._recent = set()
+                self._full_refreshed_at = now
+            for revocation_id, token_id in rows:
+                if revocation_id in self._recent:
+                    continue
+                self._filter.add(token_id)
+                self._recent.add(revocation_id)
+                self._watermark = max(self._watermark, revocation_id)
+            self._recent = {
+                revocation_id for revocation_id in self._recent
+                if revocation_id > self._watermark - self.overlap
+            }
+            self._refreshed_at = now
+
+    async def is_revoked(
+            self,
+            token_id: uuid.UUID,
+            session: AsyncSession
+    ) -> bool:
+        await self.refresh(session)
+        if token_id not in self._filter:
+            return False
+        query = select(RefreshTokenRevocation.id).where(
+            RefreshTokenRevocation.token_id == token_id
+        ).limit(1)
+        revoked = await session.scalar(query) is not None
+        if not revoked:
+            self.false_positives += 1
+        return revoked
+
+    def add(self, token_id: uuid.UUID) -> None:
+        """
+        Отзыв, сделанный этим процессом, виден ему сразу
+        """
+
+        self._filter.add(token_id)
+
+    def stats(self) -> dict:
+        return {
+            "revoked": self._filter.count,
+            "bits": self._filter.size,
+            "hashes": self._filter.hashes,
+            "false_positives": self.false_positives,
+        }
+
+
+refresh_token_revocations = RevocationFilter(
+    capacity=REVOCATION_FILTER_CAPACITY,
+    error_rate=REVOCATION_FILTER_ERROR_RATE,
+    refresh_interval=REVOCATIONS_REFRESH_SECONDS,
+    full_refresh_interval=REVOCATIONS_FULL_REFRESH_SECONDS,
+    overlap=REVOCATIONS_WATERMARK_OVERLAP
+)
@@ -1,6 +1,28 @@
-from jose import jwt
+import base64
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from dataclasses import dataclass
 
-from settings import ALGORITHM, SECRET_KEY
+from settings import REFRESH_TOKEN_SECRET_KEY
+from utils.metrics import jwt_seconds
+from utils.tokens import token_codec
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """
+    Пользователь, восстановленный из токена без обращения к БД
+    """
+
+    id: uuid.UUID
+    role: str
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
 
 
 async def create_access_token(data: dict) -> str:
@@ -8,5 +30,91 @@ async def create_access_token(data: dict) -> str:
     Создание токена
     """
 
-    encoded_jwt = jwt.encode(claims=data, key=SECRET_KEY, algorithm=ALGORITHM)
+    started = time.perf_counter()
+    encoded_jwt = token_codec.encode(data)
+    jwt_seconds.labels("encode").observe(time.perf_counter() - started)
     return encoded_jwt
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _derive_key(label: bytes) -> bytes:
+    """
+    Отдельный ключ для каждого применения refresh токенов, чтобы подпись
+    и хеш для хранения не использовали один и тот же ключ
+    """
+
+    if not REFRESH_TOKEN_SECRET_KEY:
+        raise ValueError(
+            "Не задан REFRESH_TOKEN_SECRET_KEY или SECRET_KEY для "
+            "refresh токенов"
+        )
+    return hmac.new(
+        REFRESH_TOKEN_SECRET_KEY.encode(), label, hashlib.sha256
+    ).digest()
+
+
+# ключи вычисляются при импорте: без секрета процесс не стартует
+_REFRESH_SIGNING_KEY = _derive_key(b"refresh-token:signature")
+_REFRESH_STORAGE_KEY = _derive_key(b"refresh-token:storage")
+
+
+def _sign(payload: str) -> bytes:
+    return hmac.new(
+        _REFRESH_SIGNING_KEY, payload.encode(), hashlib.sha256
+    ).digest()
+
+
+def create_refresh_token(data: dict) -> str:
+    """
+    Непрозрачный для клиента refresh токен: данные и их HMAC-SHA256.
+    Проверка подписи не требует bcrypt и обращения к БД
+    """
+
+    payload = _b64encode(json.dumps(data, separators=(",", ":")).encode())
+    return f"{payload}.{_b64encode(_sign(payload))}"
+
+
+def decode_refresh_token(token: str) -> dict | None:
+    """
+    Данные refresh токена или None, если подпись неверна или срок истек
+    """
+
+    payload, _, signature = token.partition(".")
+    try:
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload)):
+            return None
+        data = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if data.get("exp", 0) < time.time():
+        return None
+    return data
+
+
+def hash_refresh_token(token: str) -> str:
+    """
+    Быстрый хеш с ключом для хранения refresh токена в БД
+    """
+
+    return hmac.new(
+        _REFRESH_STORAGE_KEY, token.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def decode_access_token(token: str) -> dict:
+    """
+    Проверка подписи и срока действия токена, при ошибке - InvalidToken
+    """
+
+    started = time.perf_counter()
+    try:
+        return token_codec.decode(token)
+    finally:
+        jwt_seconds.labels("decode").observe(time.perf_counter() - started)
@@ -0,0 +1,127 @@
+import datetime
+import uuid
+from typing import Any
+
+import msgpack
+import orjson
+from fastapi import Request, Response
+
+from db.models import Salary, SalaryHistory, User
+
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+NDJSON = "application/x-ndjson"
+
+# варианты, которые клиенты указывают для msgpack в заголовке Accept
+MSGPACK_MEDIA_TYPES = (MSGPACK, "application/x-msgpack")
+
+
+def salary_to_dict(salary: Salary) -> dict:
+    """
+    Зарплата в виде словаря с полями схемы GetSalary
+    """
+
+    return {
+        "id": salary.id,
+        "current_salary": salary.current_salary,
+        "increase_date": salary.increase_date,
+        "created_date": salary.created_date,
+    }
+
+
+def salary_history_to_dict(record: SalaryHistory) -> dict:
+    """
+    Запись истории зарплаты с полями схемы GetSalaryHistory
+    """
+
+    return {
+        "id": record.id,
+        "current_salary": record.current_salary,
+        "increase_date": record.increase_date,
+        "effective_date": record.effective_date,
+    }
+
+
+def user_to_dict(user: User) -> dict:
+    """
+    Пользователь с зарплатой с полями схемы GetUser
+    """
+
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "created_date": user.created_date,
+        "salary": salary_to_dict(user.salary),
+    }
+
+
+def _json_default(value: Any) -> Any:
+    # asyncpg возвращает собственный подкласс uuid.UUID, который orjson
+    # не распознает как uuid
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется")
+
+
+def _msgpack_default(value: Any) -> Any:
+    # msgpack не знает uuid и datetime, кодируем их как в JSON
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется")
+
+
+def negotiate(request: Request) -> str:
+    """
+    Формат ответа по заголовку Accept, по умолчанию JSON
+    """
+
+    accept = request.headers.get("accept", "")
+    if any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+        return MSGPACK
+    return JSON
+
+
+def dumps(content: Any, media_type: str = JSON) -> bytes:
+    if media_type == MSGPACK:
+        return msgpack.packb(content, default=_msgpack_default)
+    return orjson.dumps(content, default=_json_default)
+
+
+def dumps_line(content: Any) -> bytes:
+    """
+    Одна строка NDJSON
+    """
+
+    return orjson.dumps(
+        content, default=_json_default, option=orjson.OPT_APPEND_NEWLINE
+    )
+
+
+def serialize_response(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: dict | None = None,
+) -> Response:
+    """
+    Ответ, сериализованный один раз в формат, запрошенный клиентом.
+
+    Готовый Response FastAPI отдает как есть, без повторной валидации через
+    response_model, поэтому content должен уже соответствовать схеме ответа
+    """
+
+    media_type = negotiate(request)
+    response = Response(
+        content=dumps(content, media_type=media_type),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
+    response.headers["Vary"] = "Accept"
+    return response
@@ -0,0 +1,116 @@
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import User
+from settings import (
+    TOKEN_VERSIONS_FULL_REFRESH_SECONDS,
+    TOKEN_VERSIONS_REFRESH_SECONDS,
+    TOKEN_VERSIONS_WATERMARK_OVERLAP
+)
+
+
+class TokenVersionTable:
+    """
+    Таблица актуальных версий токенов пользователей в памяти.
+
+    Версии выдаются из общей возрастающей последовательности, поэтому
+    инкрементальное обновление забирает только строки с версией больше
+    уже известной. Транзакции фиксируются не в порядке выдачи версий,
+    поэтому перечитываются и последние overlap версий ниже известной
+    максимальной. Полная перезагрузка раз в full_refresh_interval
+    убирает удаленных в других процессах пользователей.
+    """
+
+    def __init__(
+            self,
+            refresh_interval: float,
+            full_refresh_interval: float,
+            overlap: int
+    ):
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.overlap = overlap
+        self._versions: dict[uuid.UUID, int] = {}
+        self._watermark = 0
+        self._refreshed_at = float("-inf")
+        self._full_refreshed_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def refresh(
+            self,
+            session: AsyncSession,
+            force: bool = False
+    ) -> None:
+        now = time.monotonic()
+        full = now - self._full_refreshed_at >= self.full_refresh_interval
+        if not (force or full or
+                now - self._refreshed_at >= self.refresh_interval):
+            return
+
+        async with self._lock:
+            # пока ждали блокировку, таблицу мог обновить другой запрос
+            if self._refreshed_at >= now:
+                return
+            now = time.monotonic()
+            full = now - self._full_refreshed_at >= self.full_refresh_interval
+            query = select(User.id, User.token_version)
+            if not full:
+                query = query.where(
+                    User.token_version > self._watermark - self.overlap
+                )
+            rows = (await session.execute(query)).all()
+
+            if full:
+                self._versions = {}
+                self._full_refreshed_at = now
+            for user_id, version in rows:
+                self._versions[user_id] = version
+                self._watermark = max(self._watermark, version)
+            self._refreshed_at = now
+
+    async def is_current(
+            self,
+            user_id: uuid.UUID,
+            version: int,
+            session: AsyncSession
+    ) -> bool:
+        """
+        Проверка, что токен выпущен с актуальной версией пользователя
+        """
+
+        await self.refresh(session)
+        known = self._versions.get(user_id)
+        if known is None or version > known:
+            # таблица могла еще не узнать о новой версии, уточняем по строке
+            known = await self._load(user_id=user_id, session=session)
+        return known == version
+
+    async def _load(
+            self,
+            user_id: uuid.UUID,
+            session: AsyncSession
+    ) -> int | None:
+        query = select(User.token_version).where(User.id == user_id)
+        version = await session.scalar(query)
+        if version is None:
+            self.forget(user_id)
+        else:
+            self._versions[user_id] = version
+        return version
+
+    def forget(self, user_id: uuid.UUID) -> None:
+        self._versions.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+
+token_versions = TokenVersionTable(
+    refresh_interval=TOKEN_VERSIONS_REFRESH_SECONDS,
+    full_refresh_interval=TOKEN_VERSIONS_FULL_REFRESH_SECONDS,
+    overlap=TOKEN_VERSIONS_WATERMARK_OVERLAP
+)
@@ -0,0 +1,324 @@
+import base64
+import binascii
+import calendar
+import datetime
+import hashlib
+import hmac
+import time
+
+import orjson
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from cryptography.hazmat.primitives.asymmetric.utils import (
+    decode_dss_signature,
+    encode_dss_signature
+)
+
+from settings import (
+    ALGORITHM,
+    SECRET_KEY,
+    TOKEN_ACTIVE_KID,
+    TOKEN_PRIVATE_KEY_FILE,
+    TOKEN_VERIFY_KEYS
+)
+
+
+HS256 = "HS256"
+ES256 = "ES256"
+EDDSA = "EdDSA"
+
+# поля с датами, которые в токене хранятся как unix время
+TIME_CLAIMS = ("exp", "iat", "nbf")
+
+
+class InvalidToken(Exception):
+    """
+    Токен поврежден, подписан неизвестным ключом или просрочен
+    """
+
+
+def b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+class HMACKey:
+    """
+    Общий секрет HS256. Внутренний и внешний блоки HMAC считаются
+    один раз, подпись копирует готовое состояние
+    """
+
+    alg = HS256
+
+    def __init__(self, kid: str, secret: bytes):
+        self.kid = kid
+        self.can_sign = True
+        self._hmac = hmac.new(secret, digestmod=hashlib.sha256)
+
+    def sign(self, data: bytes) -> bytes:
+        mac = self._hmac.copy()
+        mac.update(data)
+        return mac.digest()
+
+    def verify(self, data: bytes, signature: bytes) -> bool:
+        return hmac.compare_digest(self.sign(data), signature)
+
+    def jwk(self) -> None:
+        # общий секрет не публикуется
+        return None
+
+
+class ECKey:
+    """
+    ES256: ECDSA на P-256. Подпись в токене - r и s по 32 байта
+    """
+
+    alg = ES256
+
+    def __init__(
+            self,
+            kid: str,
+            key: ec.EllipticCurvePrivateKey | ec.EllipticCurvePublicKey
+    ):
+        if not isinstance(key.curve, ec.SECP256R1):
+            raise ValueError(f"Ключ {kid}: для ES256 нужна кривая P-256")
+        self.kid = kid
+        self.can_sign = isinstance(key, ec.EllipticCurvePrivateKey)
+        self._private = key if self.can_sign else None
+        self._public = key.public_key() if self.can_sign else key
+        self._ecdsa = ec.ECDSA(hashes.SHA256())
+
+    def sign(self, data: bytes) -> bytes:
+        r, s = decode_dss_signature(self._private.sign(data, self._ecdsa))
+        return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+
+    def verify(self, data: bytes, signature: bytes) -> bool:
+        if len(signature) != 64:
+            return False
+        der = encode_dss_signature(
+            int.from_bytes(signature[:32], "big"),
+            int.from_bytes(signature[32:], "big")
+        )
+        try:
+            self._public.verify(der, data, self._ecdsa)
+        except InvalidSignature:
+            return False
+        return True
+
+    def jwk(self) -> dict:
+        numbers = self._public.public_numbers()
+        return {
+            "kty": "EC", "crv": "P-256", "use": "sig", "alg": self.alg,
+            "kid": self.kid,
+            "x": b64encode(numbers.x.to_bytes(32, "big")),
+            "y": b64encode(numbers.y.to_bytes(32, "big")),
+        }
+
+
+class EdDSAKey:
+    """
+    EdDSA на Ed25519
+    """
+
+    alg = EDDSA
+
+    def __init__(
+            self,
+            kid: str,
+            key: ed25519.Ed25519PrivateKey | ed25519.Ed25519PublicKey
+    ):
+        self.kid = kid
+        self.can_sign = isinstance(key, ed25519.Ed25519PrivateKey)
+        self._private = key if self.can_sign else None
+        self._public = key.public_key() if self.can_sign else key
+
+    def sign(self, data: bytes) -> bytes:
+        return self._private.sign(data)
+
+    def verify(self, data: bytes, signature: bytes) -> bool:
+        try:
+            self._public.verify(signature, data)
+        except InvalidSignature:
+            return False
+        return True
+
+    def jwk(self) -> dict:
+        raw = self._public.public_bytes(
+            serialization.Encoding.Raw, serialization.PublicFormat.Raw
+        )
+        return {
+            "kty": "OKP", "crv": "Ed25519", "use": "sig", "alg": self.alg,
+            "kid": self.kid, "x": b64encode(raw),
+        }
+
+
+def load_key(kid: str, alg: str, material: bytes):
+    """
+    Ключ алгоритма alg: секрет для HS256, PEM закрытого или открытого
+    ключа для ES256 и EdDSA
+    """
+
+    if alg == HS256:
+        return HMACKey(kid, material)
+    if alg not in (ES256, EDDSA):
+        raise ValueError(f"Ключ {kid}: неподдерживаемый алгоритм {alg}")
+
+    if b"PRIVATE KEY" in material:
+        key = serialization.load_pem_private_key(material, password=None)
+    else:
+        key = serialization.load_pem_public_key(material)
+    if alg == ES256 and isinstance(
+        key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)
+    ):
+        return ECKey(kid, key)
+    if alg == EDDSA and isinstance(
+        key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)
+    ):
+        return EdDSAKey(kid, key)
+    raise ValueError(f"Ключ {kid}: тип ключа не подходит для {alg}")
+
+
+class TokenCodec:
+    """
+    Создание и проверка JWT (JWS compact) набором заранее подготовленных
+    ключей.
+
+    Токены подписываются активным ключом, его kid пишется в заголовок.
+    Проверка принимает любой ключ набора, поэтому при ротации старый ключ
+    оставляется только для проверки до истечения выданных им токенов.
+    Токены без kid проверяются активным ключом. Заголовки известных
+    ключей сериализуются один раз, поиск ключа по заголовку токена -
+    обращение к словарю
+    """
+
+    def __init__(self, keys: list, active_kid: str):
+        self.keys = {key.kid: key for key in keys}
+        if len(self.keys) != len(keys):
+            raise ValueError("kid ключей должны быть уникальными")
+        self.active = self.keys[active_kid]
+        if not self.active.can_sign:
+            raise ValueError(f"Для ключа {active_kid} нет закрытого ключа")
+
+        self._header = self._encode_header(self.active, with_kid=True)
+        self._keys_by_header = {}
+        for key in keys:
+            self._keys_by_header[self._encode_header(key, True)] = key
+        self._keys_by_header.setdefault(
+            self._encode_header(self.active, with_kid=False), self.active
+        )
+
+    @staticmethod
+    def _encode_header(key, with_kid: bool) -> str:
+        header = {"alg": key.alg, "typ": "JWT"}
+        if with_kid:
+            header["kid"] = key.kid
+        return b64encode(orjson.dumps(header))
+
+    def encode(self, claims: dict) -> str:
+        claims = {
+            name: calendar.timegm(value.utctimetuple())
+            if name in TIME_CLAIMS and isinstance(value, datetime.datetime)
+            else value
+            for name, value in claims.items()
+        }
+        signing_input = f"{self._header}.{b64encode(orjson.dumps(claims))}"
+        signature = self.active.sign(signing_input.encode())
+        return f"{signing_input}.{b64encode(signature)}"
+
+    def _key_for(self, header_segment: str):
+        key = self._keys_by_header.get(header_segment)
+        if key is not None:
+            return key
+        # заголовок с другим порядком полей или лишними полями
+        header = _loads(header_segment)
+        kid = header.get("kid")
+        key = self.keys.get(kid) if kid is not None else self.active
+        # алгоритм задается ключом, а не заголовком токена
+        if key is None or header.get("alg") != key.alg:
+            raise InvalidToken("Неизвестный ключ или алгоритм")
+        return key
+
+    def decode(self, token: str) -> dict:
+        try:
+            signing_input, _, signature = token.rpartition(".")
+            header_segment, _, payload_segment = signing_input.partition(".")
+            key = self._key_for(header_segment)
+            valid = key.verify(signing_input.encode(), b64decode(signature))
+        except (ValueError, binascii.Error):
+            raise InvalidToken("Поврежденный токен")
+        if not valid:
+            raise InvalidToken("Неверная подпись")
+
+        claims = _loads(payload_segment)
+        now = time.time()
+        if "exp" in claims and not _before(now, claims["exp"]):
+            raise InvalidToken("Срок действия токена истек")
+        if "nbf" in claims and _before(now, claims["nbf"]):
+            raise InvalidToken("Токен еще не действует")
+        return claims
+
+    def jwks(self) -> dict:
+        """
+        Открытые ключи для проверки токенов другими сервисами
+        """
+
+        return {"keys": [
+            jwk for jwk in (key.jwk() for key in self.keys.values()) if jwk
+        ]}
+
+
+def _loads(segment: str) -> dict:
+    try:
+        value = orjson.loads(b64decode(segment))
+    except (ValueError, binascii.Error):
+        raise InvalidToken("Поврежденный токен")
+    if not isinstance(value, dict):
+        raise InvalidToken("Поврежденный токен")
+    return value
+
+
+def _before(now: float, timestamp) -> bool:
+    if not isinstance(timestamp, (int, float)):
+        raise InvalidToken("Поврежденный токен")
+    return now < timestamp
+
+
+def get_unverified_claims(token: str) -> dict:
+    """
+    Данные токена без проверки подписи
+    """
+
+    parts = token.split(".")
+    if len(parts) != 3:
+        raise InvalidToken("Поврежденный токен")
+    return _loads(parts[1])
+
+
+def read_key_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read().strip()
+
+
+def load_codec() -> TokenCodec:
+    """
+    Ключи из настроек: активный - SECRET_KEY для HS256 или
+    TOKEN_PRIVATE_KEY_FILE для ES256 и EdDSA, остальные -
+    TOKEN_VERIFY_KEYS в формате kid:алгоритм:путь через запятую
+    """
+
+    if ALGORITHM == HS256:
+        material = SECRET_KEY.encode()
+    else:
+        material = read_key_file(TOKEN_PRIVATE_KEY_FILE)
+    keys = [load_key(TOKEN_ACTIVE_KID, ALGORITHM, material)]
+    for entry in TOKEN_VERIFY_KEYS:
+        kid, alg, path = entry.split(":", 2)
+        keys.append(load_key(kid, alg, read_key_file(path)))
+    return TokenCodec(keys=keys, active_kid=TOKEN_ACTIVE_KID)
+
+
+token_codec = load_codec()
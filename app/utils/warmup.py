@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from api.actions.user_actions import (
+    get_user_by_username_action,
+    get_user_by_uuid_action
+)
+from db.partitions import create_upcoming_salary_history_partitions
+from settings import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    DB_POOL_SIZE,
+    WARM_UP_RETRY_MAX_SECONDS,
+    WARM_UP_RETRY_MIN_SECONDS
+)
+from utils.hashing import hashing_service
+from utils.security import create_access_token, decode_access_token
+
+
+# логгер uvicorn настроен по умолчанию, сообщения о старте видны сразу
+logger = logging.getLogger("uvicorn.error")
+
+
+class Readiness:
+    """
+    Состояние прогрева процесса: готов ли он принимать трафик
+    и сколько занял каждый этап
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.phases: dict[str, dict] = {}
+
+    def as_dict(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "warming_up",
+            "phases": self.phases,
+        }
+
+
+readiness = Readiness()
+
+
+async def warm_up_connections(engines: list[AsyncEngine]) -> None:
+    """
+    Открытие DB_POOL_SIZE соединений каждого движка и компиляция горячих
+    запросов аутентификации на каждом из них
+    """
+
+    for engine in engines:
+        async with AsyncExitStack() as stack:
+            # соединения берутся одновременно, чтобы пул открыл новые,
+            # а не отдал одно и то же
+            connections = await asyncio.gather(*(
+                stack.enter_async_context(engine.connect())
+                for _ in range(DB_POOL_SIZE)
+            ))
+            for connection in connections:
+                # запросы выполняются так же, как в actions: SQLAlchemy
+                # кеширует компиляцию, asyncpg - подготовленные выражения
+                session = AsyncSession(bind=connection)
+                await get_user_by_uuid_action(id=uuid.uuid4(), session=session)
+                await get_user_by_username_action(
+                    username="warm-up", session=session
+                )
+                await session.close()
+
+
+async def warm_up_partitions(engine: AsyncEngine) -> None:
+    async with AsyncSession(bind=engine) as session:
+        await create_upcoming_salary_history_partitions(session=session)
+        await session.commit()
+
+
+async def warm_up_jwt() -> None:
+    expire_time = datetime.utcnow() + timedelta(
+        minutes=ACCESS_TOKEN_EXPIRE_MINUTES
+    )
+    token = await create_access_token(data={
+        "sub": str(uuid.uuid4()), "exp": expire_time, "role": "user",
+        "ver": 0,
+    })
+    decode_access_token(token)
+
+
+async def _run_phase(name: str, phase: Callable[[], Awaitable]) -> bool:
+    started = time.perf_counter()
+    error = None
+    try:
+        await phase()
+    except Exception as exc:
+        error = repr(exc)
+        logger.exception("Прогрев: этап %s завершился ошибкой", name)
+    elapsed = time.perf_counter() - started
+    attempts = readiness.phases.get(name, {}).get("attempts", 0) + 1
+    readiness.phases[name] = {
+        "seconds": elapsed, "error": error, "attempts": attempts
+    }
+    logger.info("Прогрев: этап %s занял %.3f с", name, elapsed)
+    return error is None
+
+
+async def warm_up(engines: list[AsyncEngine]) -> None:
+    """
+    Прогрев процесса перед приемом трафика.
+
+    Без соединений с БД процесс может отвечать только ошибками, поэтому
+    этот этап повторяется с растущей паузой, пока не пройдет, и только
+    после него процесс становится готовым. Ошибка остальных этапов
+    логируется и на готовность не влияет
+    """
+
+    critical_phases = (
+        ("db_connections", lambda: warm_up_connections(engines)),
+    )
+    optional_phases = (
+        ("salary_history_partitions", lambda: warm_up_partitions(engines[0])),
+        ("jwt", warm_up_jwt),
+        ("hashing", hashing_service.warm_up),
+    )
+    started = time.perf_counter()
+    for name, phase in critical_phases:
+        delay = WARM_UP_RETRY_MIN_SECONDS
+        while not await _run_phase(name, phase):
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, WARM_UP_RETRY_MAX_SECONDS)
+    for name, phase in optional_phases:
+        await _run_phase(name, phase)
+
+    readiness.ready = True
+    logger.info("Прогрев завершен за %.3f с", time.perf_counter() - started)